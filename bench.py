@@ -0,0 +1,157 @@
+"""Đo hiệu năng các phần nặng của FolderSync Pro.
+
+    python bench.py cpu [--files N] [--size-kb K] [--workers 1,2,4]
+    python bench.py memory [--rows N] [--budget-mb M] [--scan THƯ_MỤC]
+
+cpu: thời gian hash (chế độ strict) và mã hóa XOR qua CpuExecutor với các
+kiểu pool inline / thread / process và số worker khác nhau, trên một cây
+file tổng hợp trong thư mục tạm.
+
+memory: nạp N dòng tổng hợp vào FileTable (và quét THƯ_MỤC bằng scan_tree nếu
+có) rồi in RSS cao nhất, số byte trong RAM và số byte đã ghi ra file tạm. Chạy
+riêng lệnh này trong một tiến trình để RSS không bị lẫn với lệnh cpu.
+"""
+import argparse
+import multiprocessing
+import os
+import shutil
+import sys
+import tempfile
+import time
+from collections import deque
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from main import (  # noqa: E402
+    ENCRYPTION_KEY, SCAN_MEMORY_BUDGET, CpuExecutor, FileTable, LocalBackend,
+    _file_hash_worker, format_size, peak_rss_mb, scan_tree,
+)
+
+
+def make_files(root: str, count: int, size: int) -> list:
+    """Tạo count file ngẫu nhiên, mỗi file size byte; trả về tên file"""
+    names = []
+    for i in range(count):
+        name = f"file_{i:05d}.bin"
+        with open(os.path.join(root, name), 'wb') as f:
+            f.write(os.urandom(size))
+        names.append(name)
+    return names
+
+
+def run_windowed(submit, items, max_inflight: int):
+    """Gửi tác vụ giữ tối đa max_inflight Future đang chờ, giống vòng đồng bộ"""
+    inflight = deque()
+    for item in items:
+        inflight.append(submit(item))
+        if len(inflight) >= max_inflight:
+            inflight.popleft().result()
+    while inflight:
+        inflight.popleft().result()
+
+
+def bench_cpu(args):
+    workers_list = [int(w) for w in args.workers.split(',')] if args.workers else \
+        sorted({1, 2, 4, os.cpu_count() or 1})
+    total = args.files * args.size_kb * 1024
+    print(f"{args.files} file x {args.size_kb} KB = {format_size(total)}, {os.cpu_count()} nhân CPU")
+    print(f"{'pool':<8} {'worker':>6} {'hash strict':>14} {'mã hóa':>14}")
+
+    with tempfile.TemporaryDirectory(prefix='foldersync-bench-') as tmp:
+        src = os.path.join(tmp, 'src')
+        dst = os.path.join(tmp, 'dst')
+        os.makedirs(src)
+        names = make_files(src, args.files, args.size_kb * 1024)
+        shutil.copytree(src, dst)
+        for backend in ('inline', 'thread', 'process'):
+            for workers in ([1] if backend == 'inline' else workers_list):
+                executor = CpuExecutor(backend, workers)
+                local = LocalBackend(dst, executor)
+                # Khởi động pool trước khi đo
+                executor.submit(_file_hash_worker, os.path.join(src, names[0])).result()
+
+                # Strict: hash cả file nguồn và file đích rồi so sánh
+                start = time.perf_counter()
+                pairs = deque()
+                for name in names:
+                    pairs.append((executor.submit(_file_hash_worker, os.path.join(src, name)),
+                                  local.file_hash(name)))
+                    if len(pairs) * 2 >= local.max_inflight:
+                        src_hash, dst_hash = pairs.popleft()
+                        assert src_hash.result() == dst_hash.result()
+                while pairs:
+                    src_hash, dst_hash = pairs.popleft()
+                    assert src_hash.result() == dst_hash.result()
+                hash_time = time.perf_counter() - start
+
+                enc_root = os.path.join(tmp, f'enc_{backend}_{workers}')
+                enc_local = LocalBackend(enc_root, executor)
+                start = time.perf_counter()
+                run_windowed(lambda name: enc_local.put_file(os.path.join(src, name), name, key=ENCRYPTION_KEY),
+                             names, local.max_inflight)
+                enc_time = time.perf_counter() - start
+                shutil.rmtree(enc_root)
+                executor.shutdown()
+
+                print(f"{backend:<8} {workers:>6} "
+                      f"{format_size(2 * total / hash_time) + '/s':>14} "
+                      f"{format_size(total / enc_time) + '/s':>14}")
+
+
+def report_table(label: str, table: FileTable, elapsed: float):
+    print(f"{label}: {len(table):,} file, {len(table.dirs):,} thư mục trong {elapsed:.1f}s, "
+          f"RAM {format_size(table.resident_bytes)}, file tạm {format_size(table.spilled_bytes)}, "
+          f"RSS cao nhất {peak_rss_mb():.0f} MB")
+
+
+def bench_memory(args):
+    budget = args.budget_mb * 1024 * 1024
+    print(f"RSS ban đầu {peak_rss_mb():.0f} MB, giới hạn bộ nhớ quét {args.budget_mb} MB")
+
+    # Cây tổng hợp: 1000 file mỗi thư mục, 100 thư mục mỗi nhóm
+    start = time.perf_counter()
+    table = FileTable(budget)
+    files_per_dir = 1000
+    dir_id = 0
+    for i in range(args.rows):
+        if i % files_per_dir == 0:
+            n = i // files_per_dir
+            parent = table.add_dir(f"group_{n // 100:04d}", 0) if n % 100 == 0 else parent
+            dir_id = table.add_dir(f"dir_{n:06d}", parent)
+        table.append(dir_id, f"file_{i:08d}.dat", i & 0xFFFFF, 1_600_000_000_000_000_000 + i)
+    report_table("FileTable", table, time.perf_counter() - start)
+
+    start = time.perf_counter()
+    rows = sum(1 for _ in table.iter_paths())
+    assert rows == args.rows
+    print(f"Duyệt lại {rows:,} dòng trong {time.perf_counter() - start:.1f}s, "
+          f"RSS cao nhất {peak_rss_mb():.0f} MB")
+    table.close()
+
+    if args.scan:
+        start = time.perf_counter()
+        table = scan_tree(args.scan, budget)
+        report_table(f"scan_tree {args.scan}", table, time.perf_counter() - start)
+        table.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = parser.add_subparsers(dest='command', required=True)
+    cpu = sub.add_parser('cpu', help="hash strict và mã hóa theo kiểu pool / số worker")
+    cpu.add_argument('--files', type=int, default=64)
+    cpu.add_argument('--size-kb', type=int, default=4096)
+    cpu.add_argument('--workers', default="", help="danh sách số worker, ví dụ 1,2,4,8")
+    cpu.set_defaults(func=bench_cpu)
+    memory = sub.add_parser('memory', help="RSS cao nhất khi nạp FileTable / scan_tree")
+    memory.add_argument('--rows', type=int, default=10_000_000)
+    memory.add_argument('--budget-mb', type=int, default=SCAN_MEMORY_BUDGET // (1024 * 1024))
+    memory.add_argument('--scan', default="", help="thư mục thật để quét thêm bằng scan_tree")
+    memory.set_defaults(func=bench_memory)
+    args = parser.parse_args(argv)
+    args.func(args)
+
+
+if __name__ == '__main__':
+    multiprocessing.freeze_support()
+    main()
@@ -1,3 +1,4 @@
+import abc
 import os
 import shutil
 import threading
@@ -11,15 +12,1283 @@ import hashlib
 import logging
 from watchdog.observers import Observer
 from watchdog.events import FileSystemEventHandler
-from queue import Queue
-import winreg
+from queue import Queue, Empty
+try:
+    import winreg
+except ImportError:
+    # Máy chủ lưu trữ (--serve) có thể chạy trên hệ điều hành khác Windows
+    winreg = None
 import sys
-from typing import Optional, Tuple, List, Dict
+import multiprocessing
+import ctypes
+import hmac
+import ipaddress
+import secrets
+import argparse
+import socket
+import socketserver
+import urllib.parse
+import struct
+import tempfile
+from array import array
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Optional, Tuple, List, Dict, Union
 
 # Constants
 CONFIG_FILE = "config.json"
 LOG_FILE = "sync.log"
+INDEX_FILE = "file_index.jsonl"
+PLAN_FILE = "sync_plan.txt"
+THROUGHPUT_FILE = "throughput.json"
 DEFAULT_INTERVAL = 5  # minutes
+SCAN_MEMORY_BUDGET = 64 * 1024 * 1024  # bytes dữ liệu quét giữ trong RAM
+REMOTE_SCHEME = "tcp://"
+REMOTE_PORT = 8765
+REMOTE_CONNECTIONS = 4
+REMOTE_PIPELINE_DEPTH = 64  # yêu cầu chờ phản hồi tối đa trên mỗi kết nối
+REMOTE_LIST_BATCH = 64  # số thư mục liệt kê trong một yêu cầu
+REMOTE_TIMEOUT = 30  # seconds
+REMOTE_MAX_HEADER = 1024 * 1024  # bytes, kích thước tối đa một yêu cầu máy chủ chấp nhận
+PLAN_SKIP, PLAN_COPY, PLAN_UPDATE, PLAN_DELETE = range(4)
+PLAN_ACTIONS = {
+    PLAN_SKIP: "Bỏ qua",
+    PLAN_COPY: "Copy mới",
+    PLAN_UPDATE: "Cập nhật",
+    PLAN_DELETE: "Xóa"
+}
+POLL_MIN_INTERVAL = 1.0  # seconds
+POLL_MAX_INTERVAL = 30.0  # seconds
+POLL_FULL_RESCAN_EVERY = 10  # chu kỳ poll giữa 2 lần stat lại toàn bộ file
+REALTIME_QUEUE_SIZE = 10000  # sự kiện real-time chờ xử lý tối đa (watcher chờ khi đầy)
+INDEX_OVERLAY_MAX = 100000  # số thay đổi chưa lưu trước khi ghi index ra đĩa
+INDEX_SAVE_INTERVAL = 60.0  # seconds
+NETWORK_FS_TYPES = {'nfs', 'nfs4', 'cifs', 'smb3', 'smbfs', 'fuse.sshfs', '9p'}
+HASH_CHUNK_SIZE = 1024 * 1024  # bytes
+LARGE_FILE_SIZE = 64 * 1024 * 1024  # file lớn hơn được copy theo khối để báo tiến trình
+ENCRYPT_RANGE_SIZE = 16 * 1024 * 1024  # mỗi tác vụ mã hóa một đoạn của file lớn
+PROGRESS_REFRESH_INTERVAL = 0.2  # seconds
+RATE_SAMPLE_INTERVAL = 1.0  # seconds
+ETA_SMOOTHING = 0.2  # hệ số trung bình trượt mũ cho tốc độ hiện tại
+THROUGHPUT_SMOOTHING = 0.3  # hệ số cập nhật tốc độ lưu giữa các lần chạy
+THROUGHPUT_MIN_BYTES = 1024 * 1024  # lần chạy nhỏ hơn không đủ tin cậy để cập nhật tốc độ
+THROUGHPUT_MIN_SECONDS = 1.0
+ENCRYPTION_KEY = 0x55  # Trong thực tế nên dùng key từ file
+_XOR_TABLE = bytes(b ^ ENCRYPTION_KEY for b in range(256))
+
+
+def _file_hash_worker(filepath: str, chunk_size: int = HASH_CHUNK_SIZE) -> str:
+    """Tính hash MD5 của file (chạy được trong tiến trình con)"""
+    hash_md5 = hashlib.md5()
+    buf = bytearray(chunk_size)
+    view = memoryview(buf)
+    with open(filepath, "rb", buffering=0) as f:
+        while True:
+            n = f.readinto(buf)
+            if not n:
+                break
+            hash_md5.update(view[:n])
+    return hash_md5.hexdigest()
+
+
+def _encrypt_file_worker(src: str, dst: str, chunk_size: int = HASH_CHUNK_SIZE) -> int:
+    """Mã hóa XOR file theo từng khối (chạy được trong tiến trình con), trả về số byte đã ghi"""
+    written = 0
+    with open(src, 'rb') as f_src, open(dst, 'wb') as f_dst:
+        for chunk in iter(lambda: f_src.read(chunk_size), b""):
+            f_dst.write(chunk.translate(_XOR_TABLE))
+            written += len(chunk)
+    shutil.copystat(src, dst)  # giữ mtime như copy2 để so sánh (size, mtime) với nguồn
+    return written
+
+
+def _encrypt_range_worker(src: str, dst: str, offset: int, length: int, chunk_size: int = HASH_CHUNK_SIZE) -> int:
+    """Mã hóa XOR đoạn [offset, offset + length) của src vào cùng vị trí trong dst đã tạo sẵn, trả về số byte đã ghi"""
+    written = 0
+    with open(src, 'rb') as f_src, open(dst, 'r+b') as f_dst:
+        f_src.seek(offset)
+        f_dst.seek(offset)
+        while written < length:
+            chunk = f_src.read(min(chunk_size, length - written))
+            if not chunk:
+                break
+            f_dst.write(chunk.translate(_XOR_TABLE))
+            written += len(chunk)
+    return written
+
+
+def _run_to_future(fn, *args) -> Future:
+    """Chạy hàm ngay trên thread hiện tại, gói kết quả/lỗi vào Future"""
+    future = Future()
+    try:
+        future.set_result(fn(*args))
+    except Exception as e:
+        future.set_exception(e)
+    return future
+
+
+def _map_future(future: Future, fn) -> Future:
+    """Future mới có kết quả là fn(kết quả của future)"""
+    mapped = Future()
+    
+    def done(f):
+        try:
+            mapped.set_result(fn(f.result()))
+        except Exception as e:
+            mapped.set_exception(e)
+    future.add_done_callback(done)
+    return mapped
+
+
+class CpuExecutor:
+    """Điều phối công việc nặng CPU (hash, mã hóa) sang pool tiến trình.
+
+    Tiến trình con chỉ nhận đường dẫn file và tự đọc theo từng khối, nên nội
+    dung file không bị pickle qua lại giữa các tiến trình. Copy thuần I/O vẫn
+    chạy trên thread đồng bộ.
+    """
+    BACKENDS = ('process', 'thread', 'inline')
+
+    def __init__(self, backend: str = 'process', workers: int = 0):
+        self.backend = None
+        self.workers = 0
+        self._pool = None
+        self._lock = threading.Lock()
+        self.configure(backend, workers)
+
+    def configure(self, backend: str, workers: int):
+        """Đổi loại pool / số worker (0 = theo số nhân CPU)"""
+        if backend not in self.BACKENDS:
+            backend = 'process'
+        if not workers or workers < 0:
+            workers = os.cpu_count() or 1
+        with self._lock:
+            if (backend, workers) == (self.backend, self.workers):
+                return
+            self._shutdown_pool()
+            self.backend = backend
+            self.workers = workers
+
+    @property
+    def max_inflight(self) -> int:
+        """Số tác vụ tối đa được gửi đi cùng lúc"""
+        return self.workers * 2
+
+    def _get_pool(self):
+        with self._lock:
+            if self._pool is None and self.backend != 'inline' and self.workers > 1:
+                try:
+                    if self.backend == 'process':
+                        self._pool = ProcessPoolExecutor(max_workers=self.workers)
+                    else:
+                        self._pool = ThreadPoolExecutor(max_workers=self.workers)
+                except (OSError, ValueError, NotImplementedError):
+                    self.backend = 'inline'
+            return self._pool
+
+    def _shutdown_pool(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+    def submit(self, fn, *args) -> Future:
+        """Gửi tác vụ vào pool; chạy trực tiếp nếu không có pool"""
+        pool = self._get_pool()
+        if pool is not None:
+            try:
+                return pool.submit(fn, *args)
+            except RuntimeError:
+                # Pool hỏng (BrokenProcessPool) hoặc đã đóng: tạo lại ở lần sau
+                with self._lock:
+                    self._shutdown_pool()
+        return _run_to_future(fn, *args)
+
+    def shutdown(self):
+        """Đóng pool"""
+        with self._lock:
+            self._shutdown_pool()
+
+class DirNode:
+    """Nút thư mục dùng chung cho mọi file bên trong, tránh lặp lại chuỗi đường dẫn cha"""
+    __slots__ = ('name', 'parent')
+
+    def __init__(self, name: str, parent: Optional['DirNode'] = None):
+        self.name = name
+        self.parent = parent
+
+    def rel_path(self) -> str:
+        """Đường dẫn tương đối so với thư mục gốc của bảng ('' là gốc)"""
+        parts = []
+        node = self
+        while node.parent is not None:
+            parts.append(node.name)
+            node = node.parent
+        return os.path.join(*reversed(parts)) if parts else ''
+
+
+class FileTable:
+    """Bảng kết quả quét dạng cột (array) thay vì dict/tuple cho từng file.
+
+    Mỗi khối CHUNK_ROWS dòng lưu dir_id, size, mtime_ns, flags trong array và
+    tên file nối liền trong một bytearray. Khi các khối trong RAM vượt
+    memory_budget, khối cũ nhất được ghi ra file tạm và đọc lại khi duyệt.
+    """
+    CHUNK_ROWS = 65536
+    _HEADER = struct.Struct('<6Q')
+
+    def __init__(self, memory_budget: int = SCAN_MEMORY_BUDGET):
+        self.memory_budget = memory_budget
+        self.dirs = [DirNode('')]  # dir_id -> DirNode, 0 là thư mục gốc
+        self.spilled_bytes = 0
+        self._count = 0
+        self._chunks = []     # các khối đã đầy còn trong RAM
+        self._resident = 0    # số byte của các khối trong RAM
+        self._spill_file = None
+        self._spilled = []    # (offset, độ dài) của từng khối trong file tạm
+        self._current = self._new_chunk()
+
+    @staticmethod
+    def _new_chunk():
+        # dir_ids, sizes, mtimes, flags, name_ends, names
+        return (array('I'), array('q'), array('q'), array('B'), array('I'), bytearray())
+
+    @staticmethod
+    def _chunk_nbytes(chunk) -> int:
+        return sum(len(col) * col.itemsize for col in chunk[:5]) + len(chunk[5])
+
+    def __len__(self) -> int:
+        return self._count
+
+    @property
+    def resident_bytes(self) -> int:
+        """Số byte dữ liệu file đang nằm trong RAM"""
+        return self._resident + self._chunk_nbytes(self._current)
+
+    def add_dir(self, name: str, parent_id: int) -> int:
+        """Thêm thư mục con, trả về dir_id"""
+        self.dirs.append(DirNode(sys.intern(name), self.dirs[parent_id]))
+        return len(self.dirs) - 1
+
+    def append(self, dir_id: int, name: str, size: int, mtime_ns: int, flags: int = 0):
+        """Thêm một file vào bảng"""
+        dir_ids, sizes, mtimes, flag_col, name_ends, names = self._current
+        names += name.encode('utf-8', 'surrogatepass')
+        dir_ids.append(dir_id)
+        sizes.append(size)
+        mtimes.append(mtime_ns)
+        flag_col.append(flags)
+        name_ends.append(len(names))
+        self._count += 1
+        if len(dir_ids) >= self.CHUNK_ROWS:
+            self._seal_chunk()
+
+    def _seal_chunk(self):
+        self._chunks.append(self._current)
+        self._resident += self._chunk_nbytes(self._current)
+        self._current = self._new_chunk()
+        while self._resident > self.memory_budget and self._chunks:
+            self._spill(self._chunks.pop(0))
+
+    def _spill(self, chunk):
+        if self._spill_file is None:
+            self._spill_file = tempfile.TemporaryFile(prefix='foldersync-')
+        cols = [bytes(col) if isinstance(col, bytearray) else col.tobytes() for col in chunk]
+        self._spill_file.seek(0, os.SEEK_END)
+        offset = self._spill_file.tell()
+        self._spill_file.write(self._HEADER.pack(*(len(c) for c in cols)))
+        for col in cols:
+            self._spill_file.write(col)
+        length = self._spill_file.tell() - offset
+        self._spilled.append((offset, length))
+        self._resident -= self._chunk_nbytes(chunk)
+        self.spilled_bytes += length
+
+    def _load_spilled(self, offset: int, length: int):
+        self._spill_file.seek(offset)
+        data = memoryview(self._spill_file.read(length))
+        lengths = self._HEADER.unpack_from(data)
+        chunk = self._new_chunk()
+        pos = self._HEADER.size
+        for col, n in zip(chunk, lengths):
+            if isinstance(col, bytearray):
+                col += data[pos:pos + n]
+            else:
+                col.frombytes(data[pos:pos + n])
+            pos += n
+        return chunk
+
+    def _iter_chunks(self):
+        for offset, length in self._spilled:
+            yield self._load_spilled(offset, length)
+        yield from self._chunks
+        yield self._current
+
+    def __iter__(self):
+        """Duyệt các dòng (dir_id, tên, size, mtime_ns, flags) theo thứ tự thêm vào"""
+        for dir_ids, sizes, mtimes, flag_col, name_ends, names in self._iter_chunks():
+            start = 0
+            for i, end in enumerate(name_ends):
+                name = names[start:end].decode('utf-8', 'surrogatepass')
+                start = end
+                yield dir_ids[i], name, sizes[i], mtimes[i], flag_col[i]
+
+    def iter_paths(self):
+        """Duyệt các dòng (thư mục tương đối, tên, size, mtime_ns, flags)"""
+        last_id, last_path = -1, ''
+        for dir_id, name, size, mtime_ns, flags in self:
+            if dir_id != last_id:
+                last_id, last_path = dir_id, self.dirs[dir_id].rel_path()
+            yield last_path, name, size, mtime_ns, flags
+
+    def close(self):
+        """Giải phóng bộ nhớ và file tạm"""
+        if self._spill_file is not None:
+            self._spill_file.close()
+            self._spill_file = None
+        self._chunks, self._spilled = [], []
+        self._current = self._new_chunk()
+        self._resident = 0
+
+
+def scan_tree(root: str, memory_budget: int = SCAN_MEMORY_BUDGET, include=None) -> FileTable:
+    """Quét metadata (size, mtime) của cây thư mục, không đọc nội dung file.
+
+    Thư mục được duyệt theo chiều sâu với tên đã sắp xếp, nên các dòng trong
+    bảng có thứ tự theo path_key().
+    """
+    table = FileTable(memory_budget)
+    stack = [(root, 0)]
+    while stack:
+        path, dir_id = stack.pop()
+        files, subdirs = [], []
+        try:
+            with os.scandir(path) as it:
+                for entry in it:
+                    if entry.is_dir(follow_symlinks=False):
+                        subdirs.append(entry.name)
+                    elif entry.is_file() and (include is None or include(entry.name)):
+                        st = entry.stat()
+                        files.append((entry.name, st.st_size, st.st_mtime_ns))
+        except OSError:
+            continue
+        files.sort()
+        for name, size, mtime_ns in files:
+            table.append(dir_id, name, size, mtime_ns)
+        for name in sorted(subdirs, reverse=True):
+            stack.append((os.path.join(path, name), table.add_dir(name, dir_id)))
+    return table
+
+
+def format_size(nbytes: float) -> str:
+    """Định dạng dung lượng dễ đọc"""
+    for unit in ('B', 'KB', 'MB', 'GB'):
+        if abs(nbytes) < 1024:
+            return f"{nbytes:.1f} {unit}" if unit != 'B' else f"{int(nbytes)} B"
+        nbytes /= 1024
+    return f"{nbytes:.1f} TB"
+
+
+def format_duration(seconds: Optional[float]) -> str:
+    """Định dạng thời gian dạng h:mm:ss"""
+    if seconds is None:
+        return "--:--"
+    seconds = int(seconds)
+    return f"{seconds // 3600}:{seconds // 60 % 60:02d}:{seconds % 60:02d}"
+
+
+def _list_dir_stats(path: str) -> Tuple[Dict[str, Tuple[int, int]], set]:
+    """Liệt kê một thư mục: ({tên file: (size, mtime_ns)}, {tên thư mục con})"""
+    files, subdirs = {}, set()
+    try:
+        with os.scandir(path) as it:
+            for entry in it:
+                if entry.is_dir(follow_symlinks=False):
+                    subdirs.add(entry.name)
+                elif entry.is_file():
+                    st = entry.stat()
+                    files[entry.name] = (st.st_size, st.st_mtime_ns)
+    except FileNotFoundError:
+        pass
+    return files, subdirs
+
+
+class SyncPlan:
+    """Kế hoạch đồng bộ một chiều: FileTable với flags là hành động, kèm tổng theo hành động"""
+    def __init__(self, src: str, dst: str, memory_budget: int = SCAN_MEMORY_BUDGET):
+        self.src = src
+        self.dst = dst
+        self.table = FileTable(memory_budget)
+        self.counts = dict.fromkeys(PLAN_ACTIONS, 0)
+        self.bytes = dict.fromkeys(PLAN_ACTIONS, 0)
+        self.delete_dirs = []  # dir_id của thư mục chỉ có ở đích, cha đứng trước con
+
+    def add(self, dir_id: int, name: str, size: int, mtime_ns: int, action: int):
+        self.table.append(dir_id, name, size, mtime_ns, action)
+        self.counts[action] += 1
+        self.bytes[action] += size
+
+    @property
+    def transfer_bytes(self) -> int:
+        """Tổng số byte cần copy"""
+        return self.bytes[PLAN_COPY] + self.bytes[PLAN_UPDATE]
+
+    def summary(self, rate: float = 0.0) -> str:
+        """Tóm tắt kế hoạch; rate (byte/giây) dùng để ước tính thời gian"""
+        lines = [f"{self.src} -> {self.dst}"]
+        for action in (PLAN_COPY, PLAN_UPDATE, PLAN_DELETE, PLAN_SKIP):
+            lines.append(f"  {PLAN_ACTIONS[action]}: {self.counts[action]} file, "
+                         f"{format_size(self.bytes[action])}")
+        if self.delete_dirs:
+            lines.append(f"  Xóa thư mục (nếu rỗng): {len(self.delete_dirs)}")
+        if rate > 0:
+            lines.append(f"  Dự kiến: {format_duration(self.transfer_bytes / rate)} "
+                         f"(tốc độ đo được {format_size(rate)}/s)")
+        else:
+            lines.append("  Dự kiến: chưa có dữ liệu tốc độ cho cặp thư mục này")
+        return "\n".join(lines)
+
+    def close(self):
+        self.table.close()
+
+
+class TransferProgress:
+    """Tiến trình theo byte, tốc độ và ETA làm mượt bằng trung bình trượt mũ"""
+    def __init__(self, total_bytes: int, initial_rate: float = 0.0):
+        self.total_bytes = total_bytes
+        self.done_bytes = 0
+        self.rate = initial_rate  # byte/giây
+        self.started = time.monotonic()
+        self.paused_time = 0.0
+        self._sample_time = self.started
+        self._sample_bytes = 0
+        self._lock = threading.Lock()
+
+    def advance(self, nbytes: int):
+        """Ghi nhận thêm nbytes đã xử lý"""
+        with self._lock:
+            self.done_bytes += nbytes
+            now = time.monotonic()
+            elapsed = now - self._sample_time
+            if elapsed >= RATE_SAMPLE_INTERVAL:
+                rate = (self.done_bytes - self._sample_bytes) / elapsed
+                if self.rate > 0:
+                    rate = ETA_SMOOTHING * rate + (1 - ETA_SMOOTHING) * self.rate
+                self.rate = rate
+                self._sample_time, self._sample_bytes = now, self.done_bytes
+
+    @property
+    def percent(self) -> float:
+        if self.total_bytes <= 0:
+            return 100.0
+        return min(100.0, self.done_bytes * 100 / self.total_bytes)
+
+    @property
+    def eta(self) -> Optional[float]:
+        """Số giây còn lại ước tính, None nếu chưa đo được tốc độ"""
+        if self.rate <= 0:
+            return None
+        return max(0, self.total_bytes - self.done_bytes) / self.rate
+
+    def add_paused(self, seconds: float):
+        """Loại thời gian tạm dừng khỏi thời gian chạy và mẫu đo tốc độ"""
+        with self._lock:
+            self.paused_time += seconds
+            self._sample_time += seconds
+
+    @property
+    def elapsed(self) -> float:
+        """Thời gian chạy thực, không tính lúc tạm dừng"""
+        return time.monotonic() - self.started - self.paused_time
+
+
+def path_key(rel_path: str) -> Tuple[Tuple[str, ...], str]:
+    """Khóa sắp xếp của đường dẫn tương đối, khớp thứ tự duyệt của scan_tree()"""
+    head, tail = os.path.split(rel_path)
+    return (tuple(head.split(os.sep)) if head else ()), tail
+
+
+def diff_index(old, new):
+    """So sánh 2 luồng (đường dẫn tương đối, (size, mtime_ns)) đã sắp xếp theo path_key().
+
+    Duyệt song song kiểu merge nên không cần giữ cả 2 bản index trong bộ nhớ;
+    sinh ra các cặp (hành động, đường dẫn tương đối).
+    """
+    sentinel = (None, None)
+    old_iter, new_iter = iter(old), iter(new)
+    old_path, old_stat = next(old_iter, sentinel)
+    new_path, new_stat = next(new_iter, sentinel)
+    while old_path is not None or new_path is not None:
+        if new_path is None or (old_path is not None and path_key(old_path) < path_key(new_path)):
+            yield 'deleted', old_path
+            old_path, old_stat = next(old_iter, sentinel)
+        elif old_path is None or path_key(new_path) < path_key(old_path):
+            yield 'created', new_path
+            new_path, new_stat = next(new_iter, sentinel)
+        else:
+            if tuple(old_stat) != tuple(new_stat):
+                yield 'modified', new_path
+            old_path, old_stat = next(old_iter, sentinel)
+            new_path, new_stat = next(new_iter, sentinel)
+
+
+def peak_rss_mb() -> float:
+    """Bộ nhớ RSS cao nhất của tiến trình (MB), 0 nếu không đo được"""
+    try:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+    except ImportError:
+        pass
+    
+    # Windows: PeakWorkingSetSize qua psapi
+    class ProcessMemoryCounters(ctypes.Structure):
+        _fields_ = [('cb', ctypes.c_ulong), ('PageFaultCount', ctypes.c_ulong)] + \
+                   [(name, ctypes.c_size_t) for name in (
+                       'PeakWorkingSetSize', 'WorkingSetSize', 'QuotaPeakPagedPoolUsage',
+                       'QuotaPagedPoolUsage', 'QuotaPeakNonPagedPoolUsage',
+                       'QuotaNonPagedPoolUsage', 'PagefileUsage', 'PeakPagefileUsage')]
+    try:
+        counters = ProcessMemoryCounters()
+        counters.cb = ctypes.sizeof(counters)
+        ctypes.windll.psapi.GetProcessMemoryInfo(
+            ctypes.windll.kernel32.GetCurrentProcess(), ctypes.byref(counters), counters.cb)
+        return counters.PeakWorkingSetSize / (1024 * 1024)
+    except Exception:
+        return 0.0
+
+
+def is_network_path(path: str) -> bool:
+    """Kiểm tra thư mục có nằm trên ổ mạng (SMB/NFS) không"""
+    path = os.path.abspath(path)
+    if path.startswith(('\\\\', '//')):
+        return True
+    if os.name == 'nt':
+        try:
+            drive = os.path.splitdrive(path)[0] + '\\'
+            return ctypes.windll.kernel32.GetDriveTypeW(drive) == 4  # DRIVE_REMOTE
+        except Exception:
+            return False
+    
+    # Linux: tìm mount point dài nhất chứa đường dẫn trong /proc/mounts
+    best_mount, best_type = '', ''
+    try:
+        with open('/proc/mounts', 'r') as f:
+            for line in f:
+                parts = line.split()
+                if len(parts) < 3:
+                    continue
+                mount_point = parts[1].replace('\\040', ' ')
+                if (path == mount_point or path.startswith(mount_point.rstrip('/') + '/')) \
+                        and len(mount_point) > len(best_mount):
+                    best_mount, best_type = mount_point, parts[2]
+    except OSError:
+        return False
+    return best_type in NETWORK_FS_TYPES
+
+
+class PollingWatcher(threading.Thread):
+    """Theo dõi thay đổi bằng cách stat định kỳ (dùng cho SMB/NFS hoặc khi vượt giới hạn watch).
+
+    Mỗi chu kỳ chỉ liệt kê lại các thư mục có mtime thay đổi; file bị sửa tại
+    chỗ (không đổi mtime thư mục) được phát hiện ở lần stat lại toàn bộ sau mỗi
+    POLL_FULL_RESCAN_EVERY chu kỳ. Khoảng poll tự giãn khi không có thay đổi.
+
+    Lỗi tạm thời của ổ mạng (ESTALE, ETIMEDOUT...) không bị coi là xóa: chỉ
+    thư mục con không còn (FileNotFoundError) trong khi thư mục cha vẫn đọc
+    được mới sinh sự kiện xóa. Thư mục gốc không bao giờ bị bỏ theo dõi.
+
+    Trạng thái file của mỗi thư mục được lưu gọn (tên nối liền + array
+    size/mtime) thay vì dict cho từng file, vì polling dùng cho cây thư mục
+    mạng rất lớn.
+    """
+    def __init__(self, app, root: str):
+        super().__init__(daemon=True)
+        self.app = app
+        self.root = root
+        self.interval = POLL_MIN_INTERVAL
+        self.dirs = {}   # thư mục tương đối -> mtime_ns
+        self.files = {}  # thư mục tương đối -> (tên file nối bằng '\0', array size, array mtime_ns)
+        self._stop_event = threading.Event()
+
+    def stop(self):
+        self._stop_event.set()
+
+    def run(self):
+        self._add_tree('', emit=False)
+        cycle = 0
+        while not self._stop_event.wait(self.interval):
+            cycle += 1
+            if '' not in self.dirs:
+                # Thư mục gốc chưa đọc được lúc khởi động: thử lại
+                self._add_tree('', emit=False)
+                changed = False
+            else:
+                changed = self._poll(full=cycle % POLL_FULL_RESCAN_EVERY == 0)
+            if changed:
+                self.interval = POLL_MIN_INTERVAL
+            else:
+                self.interval = min(self.interval * 2, POLL_MAX_INTERVAL)
+
+    @staticmethod
+    def _pack_files(files: Dict[str, Tuple[int, int]]) -> Tuple[bytes, array, array]:
+        names = sorted(files)
+        return ('\0'.join(names).encode('utf-8', 'surrogatepass'),
+                array('q', (files[name][0] for name in names)),
+                array('q', (files[name][1] for name in names)))
+
+    @staticmethod
+    def _unpack_files(packed: Tuple[bytes, array, array]) -> Dict[str, Tuple[int, int]]:
+        names, sizes, mtimes = packed
+        if not sizes:
+            return {}
+        return {name: (sizes[i], mtimes[i])
+                for i, name in enumerate(names.decode('utf-8', 'surrogatepass').split('\0'))}
+
+    def _emit(self, action: str, rel_dir: str, name: str):
+        self.app.file_queue.put((action, os.path.join(self.root, rel_dir, name)))
+
+    def _list_dir(self, rel_dir: str) -> Tuple[Dict[str, Tuple[int, int]], List[str]]:
+        files, subdirs = {}, []
+        with os.scandir(os.path.join(self.root, rel_dir)) as it:
+            for entry in it:
+                if entry.is_dir(follow_symlinks=False):
+                    subdirs.append(os.path.join(rel_dir, entry.name))
+                elif entry.is_file():
+                    st = entry.stat()
+                    files[entry.name] = (st.st_size, st.st_mtime_ns)
+        return files, subdirs
+
+    def _add_tree(self, rel_dir: str, emit: bool = True):
+        stack = [rel_dir]
+        while stack:
+            rel = stack.pop()
+            try:
+                mtime = os.stat(os.path.join(self.root, rel)).st_mtime_ns
+                files, subdirs = self._list_dir(rel)
+            except OSError:
+                continue
+            self.dirs[rel] = mtime
+            self.files[rel] = self._pack_files(files)
+            if emit:
+                for name in files:
+                    self._emit('created', rel, name)
+            stack.extend(subdirs)
+
+    def _remove_tree(self, rel_dir: str):
+        prefix = os.path.join(rel_dir, '')
+        for rel in [d for d in self.dirs if d == rel_dir or d.startswith(prefix)]:
+            for name in self._unpack_files(self.files.pop(rel, (b'', array('q'), array('q')))):
+                self._emit('deleted', rel, name)
+            del self.dirs[rel]
+
+    def _is_deleted(self, rel: str) -> bool:
+        """Thư mục con rel đã thật sự bị xóa (thư mục cha vẫn đọc được)"""
+        if not rel:
+            return False
+        try:
+            os.stat(os.path.join(self.root, rel))
+        except FileNotFoundError:
+            return os.path.isdir(os.path.join(self.root, os.path.dirname(rel)))
+        except OSError:
+            return False
+        return False
+
+    def _poll(self, full: bool) -> bool:
+        try:
+            os.stat(self.root)
+        except OSError:
+            # Thư mục gốc tạm thời không truy cập được: giữ nguyên trạng thái, thử lại sau
+            return False
+            
+        changed = False
+        for rel in list(self.dirs):
+            if rel not in self.dirs:
+                continue
+            try:
+                mtime = os.stat(os.path.join(self.root, rel)).st_mtime_ns
+            except OSError:
+                if self._is_deleted(rel):
+                    self._remove_tree(rel)
+                    changed = True
+                continue
+            if mtime != self.dirs[rel]:
+                changed |= self._rescan_dir(rel, mtime)
+            elif full:
+                changed |= self._restat_files(rel)
+        return changed
+
+    def _rescan_dir(self, rel: str, mtime: int) -> bool:
+        try:
+            files, subdirs = self._list_dir(rel)
+        except OSError:
+            if self._is_deleted(rel):
+                self._remove_tree(rel)
+                return True
+            return False
+        old_files = self._unpack_files(self.files[rel])
+        for name, stat in files.items():
+            old_stat = old_files.get(name)
+            if old_stat is None:
+                self._emit('created', rel, name)
+            elif old_stat != stat:
+                self._emit('modified', rel, name)
+        for name in old_files:
+            if name not in files:
+                self._emit('deleted', rel, name)
+        self.dirs[rel] = mtime
+        self.files[rel] = self._pack_files(files)
+        for subdir in subdirs:
+            if subdir not in self.dirs:
+                self._add_tree(subdir)
+        return True
+
+    def _restat_files(self, rel: str) -> bool:
+        changed = False
+        files = self._unpack_files(self.files[rel])
+        for name, old_stat in list(files.items()):
+            try:
+                st = os.stat(os.path.join(self.root, rel, name))
+            except OSError:
+                continue  # Xóa file làm đổi mtime thư mục, xử lý ở _rescan_dir
+            stat = (st.st_size, st.st_mtime_ns)
+            if stat != old_stat:
+                files[name] = stat
+                self._emit('modified', rel, name)
+                changed = True
+        if changed:
+            self.files[rel] = self._pack_files(files)
+        return changed
+
+
+class StorageBackend(abc.ABC):
+    """Giao diện nơi lưu trữ đích của bộ máy đồng bộ (thư mục cục bộ hoặc máy chủ từ xa).
+
+    Đường dẫn truyền vào là đường dẫn tương đối so với gốc của đích. Các thao
+    tác ghi trả về Future để có thể gửi nhiều yêu cầu liên tiếp.
+    """
+    location = ""
+
+    @property
+    @abc.abstractmethod
+    def max_inflight(self) -> int:
+        """Số thao tác tối đa nên chờ cùng lúc"""
+
+    @abc.abstractmethod
+    def list_dirs(self, rel_dirs: List[str]) -> List[Union[Tuple[Dict[str, Tuple[int, int]], set], OSError]]:
+        """Liệt kê nhiều thư mục: mỗi thư mục trả về ({tên file: (size, mtime_ns)}, {thư mục con}).
+
+        Thư mục không đọc được trả về OSError tại vị trí tương ứng thay vì làm
+        hỏng cả lô.
+        """
+
+    @abc.abstractmethod
+    def stat(self, rel_path: str) -> Optional[Tuple[int, int]]:
+        """(size, mtime_ns) của file, None nếu không tồn tại"""
+
+    @abc.abstractmethod
+    def file_hash(self, rel_path: str) -> Future:
+        """Hash MD5 của file"""
+
+    @abc.abstractmethod
+    def makedirs(self, rel_dir: str) -> Future:
+        """Tạo thư mục (kể cả thư mục cha)"""
+
+    @abc.abstractmethod
+    def remove(self, rel_path: str) -> Future:
+        """Xóa file; Future trả về True nếu file tồn tại và đã bị xóa"""
+
+    @abc.abstractmethod
+    def remove_dir(self, rel_dir: str) -> Future:
+        """Xóa thư mục nếu rỗng; Future trả về True nếu đã xóa"""
+
+    @abc.abstractmethod
+    def put_file(self, local_path: str, rel_path: str, key: Optional[int] = None, on_bytes=None) -> Future:
+        """Ghi file cục bộ lên đích (mã hóa XOR nếu có key).
+
+        on_bytes(n) được gọi (trên thread hiện tại) khi gửi được thêm n byte;
+        phần chưa báo được coi là xong khi Future hoàn tất.
+        """
+
+    def close(self):
+        pass
+
+
+class LocalBackend(StorageBackend):
+    """Đích là thư mục cục bộ (hoặc ổ mạng đã mount)"""
+    def __init__(self, root: str, executor: CpuExecutor):
+        if not root:
+            # Đường dẫn rỗng sẽ ghi vào thư mục làm việc của tiến trình
+            raise ValueError("Thư mục đích không hợp lệ")
+        self.root = root
+        self.location = root
+        self.executor = executor
+
+    @property
+    def max_inflight(self) -> int:
+        return self.executor.max_inflight
+
+    def _path(self, rel_path: str) -> str:
+        return os.path.join(self.root, rel_path)
+
+    def list_dirs(self, rel_dirs):
+        listings = []
+        for rel_dir in rel_dirs:
+            try:
+                listings.append(_list_dir_stats(self._path(rel_dir)))
+            except OSError as e:
+                listings.append(e)
+        return listings
+
+    def stat(self, rel_path):
+        try:
+            st = os.stat(self._path(rel_path))
+        except FileNotFoundError:
+            return None
+        return st.st_size, st.st_mtime_ns
+
+    def file_hash(self, rel_path):
+        return self.executor.submit(_file_hash_worker, self._path(rel_path))
+
+    def makedirs(self, rel_dir):
+        return _run_to_future(os.makedirs, self._path(rel_dir), 0o777, True)
+
+    def remove(self, rel_path):
+        def remove():
+            path = self._path(rel_path)
+            if not os.path.isfile(path):
+                return False
+            os.remove(path)
+            return True
+        return _run_to_future(remove)
+
+    def remove_dir(self, rel_dir):
+        def remove_dir():
+            try:
+                os.rmdir(self._path(rel_dir))
+            except OSError:
+                return False  # Không rỗng (file bị lọc bỏ) hoặc không tồn tại
+            return True
+        return _run_to_future(remove_dir)
+
+    def put_file(self, local_path, rel_path, key=None, on_bytes=None):
+        dst = self._path(rel_path)
+        try:
+            os.makedirs(os.path.dirname(dst), exist_ok=True)
+        except OSError as e:
+            future = Future()
+            future.set_exception(e)
+            return future
+        if key is not None:
+            # Mã hóa nặng CPU: gửi vào pool
+            if on_bytes is not None and os.path.getsize(local_path) >= LARGE_FILE_SIZE:
+                return _run_to_future(self._encrypt_large_file, local_path, dst, on_bytes)
+            return self.executor.submit(_encrypt_file_worker, local_path, dst)
+        return _run_to_future(self._copy_file, local_path, dst, on_bytes)
+
+    def _encrypt_large_file(self, src: str, dst: str, on_bytes):
+        """File lớn: mã hóa từng đoạn ENCRYPT_RANGE_SIZE trong pool, báo tiến trình sau mỗi đoạn.
+
+        on_bytes chạy trên thread đồng bộ nên khi tạm dừng sẽ không gửi thêm
+        đoạn mới; chỉ các đoạn đang chạy được làm nốt.
+        """
+        size = os.path.getsize(src)
+        with open(dst, 'wb') as f_dst:
+            f_dst.truncate(size)
+        ranges = deque()
+        try:
+            for offset in range(0, size, ENCRYPT_RANGE_SIZE):
+                ranges.append(self.executor.submit(
+                    _encrypt_range_worker, src, dst, offset, min(ENCRYPT_RANGE_SIZE, size - offset)))
+                if len(ranges) >= self.executor.max_inflight:
+                    on_bytes(ranges.popleft().result())
+            while ranges:
+                on_bytes(ranges.popleft().result())
+        finally:
+            for future in ranges:
+                future.cancel()
+        shutil.copystat(src, dst)
+
+    @staticmethod
+    def _copy_file(src: str, dst: str, on_bytes=None):
+        size = os.path.getsize(src)
+        if on_bytes is None or size < LARGE_FILE_SIZE:
+            shutil.copy2(src, dst)
+            return
+        # File lớn: copy theo từng khối để báo tiến trình trong lúc copy
+        with open(src, 'rb') as f_src, open(dst, 'wb') as f_dst:
+            for chunk in iter(lambda: f_src.read(HASH_CHUNK_SIZE), b""):
+                f_dst.write(chunk)
+                on_bytes(len(chunk))
+        shutil.copystat(src, dst)
+
+
+_MSG_LEN = struct.Struct('>I')
+_PAYLOAD_END = 0
+_PAYLOAD_ABORT = 0xFFFFFFFF
+
+
+def _send_msg(sock: socket.socket, header: dict):
+    data = json.dumps(header).encode('utf-8')
+    sock.sendall(_MSG_LEN.pack(len(data)) + data)
+
+
+def _recv_exact(rfile, size: int) -> bytes:
+    data = rfile.read(size)
+    if len(data) < size:
+        raise ConnectionError("Kết nối bị đóng")
+    return data
+
+
+def _recv_msg(rfile, max_size: Optional[int] = REMOTE_MAX_HEADER) -> dict:
+    """Đọc một thông điệp JSON; độ dài vượt max_size (None = không giới hạn) báo ValueError trước khi đọc"""
+    size, = _MSG_LEN.unpack(_recv_exact(rfile, _MSG_LEN.size))
+    if max_size is not None and size > max_size:
+        raise ValueError(f"Thông điệp quá lớn: {size} byte")
+    return json.loads(_recv_exact(rfile, size).decode('utf-8'))
+
+
+def _recv_payload(rfile, f_dst=None) -> bool:
+    """Đọc payload dạng khối (độ dài + dữ liệu), ghi vào f_dst nếu có; False nếu bên gửi hủy"""
+    while True:
+        size, = _MSG_LEN.unpack(_recv_exact(rfile, _MSG_LEN.size))
+        if size == _PAYLOAD_END:
+            return True
+        if size == _PAYLOAD_ABORT:
+            return False
+        while size:
+            chunk = rfile.read(min(size, HASH_CHUNK_SIZE))
+            if not chunk:
+                raise ConnectionError("Kết nối bị đóng")
+            if f_dst is not None:
+                f_dst.write(chunk)
+            size -= len(chunk)
+
+
+class _RemoteConnection:
+    """Một kết nối TCP tới StorageServer.
+
+    Yêu cầu được gửi liên tiếp không chờ phản hồi (tối đa REMOTE_PIPELINE_DEPTH
+    yêu cầu đang chờ); thread đọc nhận phản hồi theo đúng thứ tự gửi.
+    """
+    def __init__(self, host: str, port: int, token: str):
+        self.sock = socket.create_connection((host, port), timeout=REMOTE_TIMEOUT)
+        self.sock.settimeout(None)
+        self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.rfile = self.sock.makefile('rb')
+        self.alive = True
+        self.pending = deque()  # (future, lỗi cục bộ)
+        self._send_lock = threading.Lock()
+        self._slots = threading.Semaphore(REMOTE_PIPELINE_DEPTH)
+        threading.Thread(target=self._read_loop, daemon=True).start()
+        try:
+            self.request({"op": "hello", "token": token}).result(timeout=REMOTE_TIMEOUT)
+        except Exception as e:
+            self.close(e)
+            raise
+
+    def request(self, header: dict, payload: Optional[Tuple[str, Optional[int]]] = None, on_bytes=None) -> Future:
+        """Gửi yêu cầu (kèm nội dung file nếu có), trả về Future của phản hồi"""
+        self._slots.acquire()
+        future = Future()
+        entry = [future, None]
+        sent = False
+        try:
+            with self._send_lock:
+                if not self.alive:
+                    raise ConnectionError("Kết nối đã đóng")
+                self.pending.append(entry)
+                sent = True
+                _send_msg(self.sock, header)
+                if payload is not None:
+                    entry[1] = self._send_payload(*payload, on_bytes)
+        except Exception as e:
+            if sent:
+                # Luồng dữ liệu đã hỏng giữa chừng: đóng kết nối
+                self.close(e)
+            else:
+                self._slots.release()
+                future.set_exception(e)
+        return future
+
+    def _send_payload(self, local_path: str, key: Optional[int], on_bytes) -> Optional[Exception]:
+        """Gửi nội dung file theo từng khung, mã hóa XOR ngay trên thread gửi.
+
+        Hạn chế: việc mã hóa không đi qua CpuExecutor mà chạy trong lúc giữ
+        khóa gửi của kết nối. bytes.translate đủ nhanh để không thành nút cổ
+        chai so với mạng, nhưng số kết nối (remote_connections) mới là giới hạn
+        song song của bước mã hóa, không phải cpu_workers.
+        """
+        try:
+            f_src = open(local_path, 'rb')
+        except OSError as e:
+            self.sock.sendall(_MSG_LEN.pack(_PAYLOAD_ABORT))
+            return e
+        with f_src:
+            while True:
+                try:
+                    chunk = f_src.read(HASH_CHUNK_SIZE)
+                except OSError as e:
+                    self.sock.sendall(_MSG_LEN.pack(_PAYLOAD_ABORT))
+                    return e
+                if not chunk:
+                    break
+                if key is not None:
+                    chunk = chunk.translate(_XOR_TABLE)
+                self.sock.sendall(_MSG_LEN.pack(len(chunk)))
+                self.sock.sendall(chunk)
+                if on_bytes is not None:
+                    on_bytes(len(chunk))
+        self.sock.sendall(_MSG_LEN.pack(_PAYLOAD_END))
+        return None
+
+    def _read_loop(self):
+        while True:
+            try:
+                response = _recv_msg(self.rfile, None)  # phản hồi list có thể lớn
+                future, local_error = self.pending.popleft()
+            except Exception as e:
+                self.close(e)
+                return
+            self._slots.release()
+            if local_error is not None:
+                future.set_exception(local_error)
+            elif response.get("ok"):
+                future.set_result(response)
+            else:
+                future.set_exception(OSError(response.get("error", "Lỗi không xác định")))
+
+    def close(self, error: Optional[Exception] = None):
+        """Đóng kết nối, các yêu cầu đang chờ nhận lỗi"""
+        self.alive = False
+        try:
+            self.sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        self.sock.close()
+        while self.pending:
+            try:
+                future, _ = self.pending.popleft()
+            except IndexError:
+                break
+            self._slots.release()
+            if not future.done():
+                future.set_exception(ConnectionError(str(error or "Kết nối đã đóng")))
+
+
+class RemoteBackend(StorageBackend):
+    """Đích là StorageServer từ xa, địa chỉ dạng tcp://host:port/thư-mục-con.
+
+    Giữ một pool kết nối; nhiều file nhỏ được gửi liên tiếp trên cùng kết nối
+    mà không chờ phản hồi từng file, và việc liệt kê thư mục khi lập kế hoạch
+    được gom thành lô REMOTE_LIST_BATCH thư mục mỗi yêu cầu.
+    """
+    def __init__(self, url: str, connections: int = REMOTE_CONNECTIONS, token: str = ""):
+        parsed = urllib.parse.urlsplit(url)
+        if parsed.scheme != "tcp" or not parsed.hostname:
+            raise ValueError(f"Địa chỉ đích không hợp lệ: {url}")
+        self.location = url
+        self.host = parsed.hostname
+        self.port = parsed.port or REMOTE_PORT
+        self.prefix = parsed.path.strip('/')
+        self.token = token
+        self.connections = max(1, connections)
+        self._conns = []
+        self._lock = threading.Lock()
+
+    @property
+    def max_inflight(self) -> int:
+        return REMOTE_PIPELINE_DEPTH * self.connections
+
+    def _remote_path(self, rel_path: str) -> str:
+        parts = [self.prefix] + rel_path.split(os.sep)
+        return '/'.join(part for part in parts if part and part != '.')
+
+    def _connection(self) -> _RemoteConnection:
+        """Lấy kết nối ít việc nhất; mở thêm kết nối khi tất cả đều bận"""
+        with self._lock:
+            self._conns = [conn for conn in self._conns if conn.alive]
+            idle = [conn for conn in self._conns if not conn.pending]
+            if idle:
+                return idle[0]
+            if len(self._conns) < self.connections:
+                conn = _RemoteConnection(self.host, self.port, self.token)
+                self._conns.append(conn)
+                return conn
+            return min(self._conns, key=lambda conn: len(conn.pending))
+
+    def _request(self, header: dict, payload=None, on_bytes=None) -> Future:
+        return self._connection().request(header, payload, on_bytes)
+
+    def list_dirs(self, rel_dirs):
+        futures = []
+        for i in range(0, len(rel_dirs), REMOTE_LIST_BATCH):
+            batch = [self._remote_path(rel_dir) for rel_dir in rel_dirs[i:i + REMOTE_LIST_BATCH]]
+            futures.append(self._request({"op": "list", "dirs": batch}))
+        listings = []
+        for future in futures:
+            for listing in future.result(timeout=REMOTE_TIMEOUT)["listings"]:
+                if isinstance(listing, dict):
+                    listings.append(OSError(listing.get("error", "Lỗi không xác định")))
+                    continue
+                files, subdirs = listing
+                listings.append(({name: tuple(stat) for name, stat in files.items()}, set(subdirs)))
+        return listings
+
+    def stat(self, rel_path):
+        response = self._request({"op": "stat", "path": self._remote_path(rel_path)}).result(timeout=REMOTE_TIMEOUT)
+        return tuple(response["stat"]) if response["stat"] is not None else None
+
+    def file_hash(self, rel_path):
+        return _map_future(self._request({"op": "hash", "path": self._remote_path(rel_path)}),
+                           lambda response: response["hash"])
+
+    def makedirs(self, rel_dir):
+        return self._request({"op": "mkdir", "path": self._remote_path(rel_dir)})
+
+    def remove(self, rel_path):
+        return _map_future(self._request({"op": "remove", "path": self._remote_path(rel_path)}),
+                           lambda response: response["removed"])
+
+    def remove_dir(self, rel_dir):
+        return _map_future(self._request({"op": "rmdir", "path": self._remote_path(rel_dir)}),
+                           lambda response: response["removed"])
+
+    def put_file(self, local_path, rel_path, key=None, on_bytes=None):
+        try:
+            mtime_ns = os.stat(local_path).st_mtime_ns
+        except OSError as e:
+            future = Future()
+            future.set_exception(e)
+            return future
+        header = {"op": "put", "path": self._remote_path(rel_path), "mtime_ns": mtime_ns}
+        return self._request(header, (local_path, key), on_bytes)
+
+    def close(self):
+        with self._lock:
+            for conn in self._conns:
+                conn.close()
+            self._conns = []
+
+
+class StorageServer(socketserver.ThreadingTCPServer):
+    """Máy chủ lưu trữ tối giản cho RemoteBackend.
+
+    Giao thức không mã hóa đường truyền, chỉ kiểm tra token: dùng trong mạng
+    tin cậy, qua đường hầm SSH, hoặc trên localhost khi kiểm thử.
+    """
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, root: str, host: str = "127.0.0.1", port: int = REMOTE_PORT, token: str = ""):
+        self.root = os.path.realpath(root)
+        self.token = token
+        super().__init__((host, port), _StorageRequestHandler)
+
+    def local_path(self, remote_path: str) -> str:
+        """Đổi đường dẫn từ client sang đường dẫn trong root, chặn thoát ra ngoài root"""
+        parts = [part for part in remote_path.split('/') if part not in ('', '.')]
+        for part in parts:
+            if part == '..' or '\\' in part or (os.name == 'nt' and ':' in part):
+                raise ValueError(f"Đường dẫn không hợp lệ: {remote_path}")
+        path = os.path.join(self.root, *parts)
+        if os.path.commonpath([self.root, os.path.realpath(path)]) != self.root:
+            raise ValueError(f"Đường dẫn không hợp lệ: {remote_path}")
+        return path
+
+    def handle_op(self, header: dict, rfile) -> dict:
+        op = header.get("op")
+        if op == "put":
+            return self._put(header, rfile)
+            
+        path = self.local_path(header.get("path", ""))
+        if op == "stat":
+            try:
+                st = os.stat(path)
+            except FileNotFoundError:
+                return {"ok": True, "stat": None}
+            return {"ok": True, "stat": [st.st_size, st.st_mtime_ns]}
+        elif op == "hash":
+            return {"ok": True, "hash": _file_hash_worker(path)}
+        elif op == "mkdir":
+            os.makedirs(path, exist_ok=True)
+            return {"ok": True}
+        elif op == "remove":
+            if not os.path.isfile(path):
+                return {"ok": True, "removed": False}
+            os.remove(path)
+            return {"ok": True, "removed": True}
+        elif op == "rmdir":
+            if path == self.root:
+                raise ValueError("Không thể xóa thư mục gốc")
+            try:
+                os.rmdir(path)
+            except OSError:
+                return {"ok": True, "removed": False}
+            return {"ok": True, "removed": True}
+        elif op == "list":
+            listings = []
+            for remote_dir in header.get("dirs", []):
+                try:
+                    files, subdirs = _list_dir_stats(self.local_path(remote_dir))
+                except (OSError, ValueError) as e:
+                    # Lỗi riêng từng thư mục, không làm hỏng cả lô
+                    listings.append({"error": str(e)})
+                    continue
+                listings.append([files, sorted(subdirs)])
+            return {"ok": True, "listings": listings}
+        raise ValueError(f"Thao tác không hỗ trợ: {op}")
+
+    def _put(self, header: dict, rfile) -> dict:
+        try:
+            path = self.local_path(header.get("path", ""))
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = path + ".foldersync-tmp"
+            f_dst = open(tmp_path, 'wb')
+        except Exception:
+            # Vẫn phải đọc hết payload để giữ đồng bộ luồng dữ liệu
+            _recv_payload(rfile)
+            raise
+        try:
+            with f_dst:
+                complete = _recv_payload(rfile, f_dst)
+        except Exception:
+            os.remove(tmp_path)
+            raise
+        if not complete:
+            os.remove(tmp_path)
+            return {"ok": False, "error": "Client hủy gửi file"}
+        os.replace(tmp_path, path)
+        mtime_ns = header.get("mtime_ns")
+        if mtime_ns is not None:
+            os.utime(path, ns=(mtime_ns, mtime_ns))
+        return {"ok": True}
+
+
+class _StorageRequestHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        try:
+            hello = _recv_msg(self.rfile)
+        except (ConnectionError, ValueError):
+            return
+        if hello.get("op") != "hello" or not hmac.compare_digest(
+                str(hello.get("token", "")), self.server.token):
+            _send_msg(self.request, {"ok": False, "error": "Sai token"})
+            return
+        _send_msg(self.request, {"ok": True})
+        
+        while True:
+            try:
+                header = _recv_msg(self.rfile)
+            except (ConnectionError, ValueError):
+                return
+            try:
+                response = self.server.handle_op(header, self.rfile)
+            except ConnectionError:
+                return
+            except Exception as e:
+                response = {"ok": False, "error": str(e)}
+            _send_msg(self.request, response)
+
 
 class SyncHandler(FileSystemEventHandler):
     """Xử lý sự kiện thay đổi file real-time"""
@@ -49,8 +1318,16 @@ class FolderSyncApp:
         self.sync_running = False
         self.auto_sync = False
         self.paused = False
-        self.file_queue = Queue()
+        self.file_queue = Queue(maxsize=REALTIME_QUEUE_SIZE)
         self.observer = None
+        self.queue_thread = None
+        self.realtime_backend = None
+        self.last_progress_refresh = 0.0
+        self.index_overlay = {}  # thay đổi chưa lưu: đường dẫn tương đối -> (size, mtime_ns) hoặc None nếu đã xóa
+        self.index_pair = None
+        self.index_lock = threading.Lock()
+        self.index_write_lock = threading.Lock()  # chỉ một luồng ghi INDEX_FILE mỗi lúc
+        self.index_saved_at = time.monotonic()
         
         # Biến giao diện
         self.progress_value = tk.DoubleVar(value=0)
@@ -59,6 +1336,8 @@ class FolderSyncApp:
         self.bidirectional = tk.BooleanVar(value=False)
         self.current_filter = tk.StringVar(value='all')
         self.encryption_enabled = tk.BooleanVar(value=False)
+        self.mirror_delete = tk.BooleanVar(value=False)
+        self.cpu_workers = tk.IntVar(value=0)
         
         # Cấu hình filter
         self.file_filters = {
@@ -71,6 +1350,7 @@ class FolderSyncApp:
         # Khởi tạo hệ thống
         self.setup_logging()
         self.load_config()
+        self.cpu_executor = CpuExecutor(self.config["executor"], self.cpu_workers.get())
         self.load_icons()
         self.build_ui()
         self.log("Ứng dụng đã khởi động", level="info")
@@ -100,7 +1380,14 @@ class FolderSyncApp:
             "filters": {},
             "realtime": False,
             "bidirectional": False,
-            "encryption": False
+            "encryption": False,
+            "mirror_delete": False,
+            "executor": "process",
+            "cpu_workers": 0,
+            "watch_mode": "auto",
+            "scan_memory_mb": SCAN_MEMORY_BUDGET // (1024 * 1024),
+            "remote_connections": REMOTE_CONNECTIONS,
+            "remote_token": ""
         }
         
         if os.path.exists(CONFIG_FILE):
@@ -115,6 +1402,8 @@ class FolderSyncApp:
         self.interval.set(self.config["interval"])
         self.bidirectional.set(self.config["bidirectional"])
         self.encryption_enabled.set(self.config["encryption"])
+        self.mirror_delete.set(self.config["mirror_delete"])
+        self.cpu_workers.set(self.config["cpu_workers"])
         if "filters" in self.config:
             self.file_filters.update(self.config["filters"])
 
@@ -127,6 +1416,8 @@ class FolderSyncApp:
             "interval": self.interval.get(),
             "bidirectional": self.bidirectional.get(),
             "encryption": self.encryption_enabled.get(),
+            "mirror_delete": self.mirror_delete.get(),
+            "cpu_workers": self.cpu_workers.get(),
             "filters": self.file_filters,
             "realtime": self.realtime_var.get() if hasattr(self, 'realtime_var') else False
         })
@@ -257,6 +1548,12 @@ class FolderSyncApp:
             variable=self.encryption_enabled
         ).pack(anchor='w', padx=10)
         
+        ttk.Checkbutton(
+            opt_frame, 
+            text="Chế độ gương: xóa file/thư mục ở đích không còn ở nguồn", 
+            variable=self.mirror_delete
+        ).pack(anchor='w', padx=10)
+        
         # Frame filter
         filter_frame = ttk.LabelFrame(self.main_tab, text="Lọc file")
         filter_frame.pack(fill='x', padx=5, pady=5)
@@ -273,6 +1570,7 @@ class FolderSyncApp:
         
         buttons = [
             ("Đồng bộ", self.icons['sync'], self.start_sync),
+            ("Xem trước", self.icons['log'], self.preview_sync),
             ("Tạm dừng", self.icons['pause'], self.pause_sync),
             ("Tiếp tục", self.icons['resume'], self.resume_sync),
             ("Log", self.icons['log'], self.toggle_log),
@@ -343,6 +1641,13 @@ class FolderSyncApp:
         ttk.Label(auto_frame, text="Khoảng thời gian (phút):").pack(anchor='w', padx=10)
         ttk.Entry(auto_frame, textvariable=self.interval).pack(anchor='w', padx=10, pady=5, fill='x')
         
+        # Frame hiệu năng
+        perf_frame = ttk.LabelFrame(self.advanced_tab, text="Hiệu năng")
+        perf_frame.pack(fill='x', padx=5, pady=5)
+        
+        ttk.Label(perf_frame, text="Số tiến trình xử lý hash/mã hóa (0 = tự động):").pack(anchor='w', padx=10)
+        ttk.Entry(perf_frame, textvariable=self.cpu_workers).pack(anchor='w', padx=10, pady=5, fill='x')
+        
         # Frame filter tùy chỉnh
         custom_filter_frame = ttk.LabelFrame(self.advanced_tab, text="Bộ lọc tùy chỉnh")
         custom_filter_frame.pack(fill='x', padx=5, pady=5)
@@ -426,6 +1731,8 @@ class FolderSyncApp:
     def enable_autostart(self):
         """Thêm vào khởi động cùng Windows"""
         try:
+            if winreg is None:
+                raise OSError("Chỉ hỗ trợ trên Windows")
             key = winreg.OpenKey(
                 winreg.HKEY_CURRENT_USER,
                 r"Software\Microsoft\Windows\CurrentVersion\Run",
@@ -503,79 +1810,339 @@ class FolderSyncApp:
 
     def start_realtime_sync(self):
         """Bắt đầu theo dõi thay đổi real-time"""
-        if hasattr(self, 'observer') and self.observer.is_alive():
+        if self.observer is not None and self.observer.is_alive():
             return
             
         src = self.src_entry.get()
+        dst = self.dst_entry.get()
         if not src or not os.path.exists(src):
             self.log("Không thể bật real-time: Thư mục nguồn không hợp lệ", level="error")
             self.realtime_var.set(False)
             return
+        if not dst or (not dst.startswith(REMOTE_SCHEME) and not os.path.exists(dst)):
+            self.log("Không thể bật real-time: Thư mục đích không hợp lệ", level="error")
+            self.realtime_var.set(False)
+            return
             
         try:
-            event_handler = SyncHandler(self)
-            self.observer = Observer()
-            self.observer.schedule(event_handler, src, recursive=True)
-            self.observer.start()
-            threading.Thread(target=self.process_queue, daemon=True).start()
+            self.open_file_index(src, dst)
+            self.realtime_backend = self.make_backend(dst)
+            self.observer = self._create_watcher(src)
+            if self.queue_thread is None or not self.queue_thread.is_alive():
+                self.queue_thread = threading.Thread(target=self.process_queue, daemon=True)
+                self.queue_thread.start()
+            threading.Thread(target=self._realtime_catch_up, args=(src, self.realtime_backend),
+                             daemon=True).start()
             self.log("Đã bật đồng bộ real-time", level="info")
         except Exception as e:
             self.log(f"Lỗi khi bật real-time: {str(e)}", level="error")
             self.realtime_var.set(False)
 
+    def _create_watcher(self, src: str):
+        """Tạo watcher: watchdog native, hoặc polling cho ổ mạng / khi vượt giới hạn watch"""
+        watch_mode = self.config.get('watch_mode', 'auto')
+        if watch_mode == 'auto' and is_network_path(src):
+            self.log("Thư mục nguồn nằm trên ổ mạng, dùng chế độ polling", level="info")
+            watch_mode = 'polling'
+            
+        if watch_mode != 'polling':
+            observer = Observer()
+            try:
+                observer.schedule(SyncHandler(self), src, recursive=True)
+                observer.start()
+                return observer
+            except OSError as e:
+                if watch_mode == 'native':
+                    raise
+                # Ví dụ: inotify hết watch (ENOSPC) trên cây thư mục lớn
+                self.log(f"Không theo dõi native được ({str(e)}), chuyển sang polling", level="warning")
+                
+        watcher = PollingWatcher(self, src)
+        watcher.start()
+        return watcher
+
+    def _realtime_catch_up(self, src: str, backend: StorageBackend):
+        """Đối chiếu nguồn với index đã lưu để bắt kịp thay đổi lúc ứng dụng tắt.
+
+        Chưa có index cho cặp thư mục (lần đầu bật real-time) thì index được
+        dựng từ danh sách file ở đích trước, để không copy lại cả cây.
+        """
+        table = scan_tree(src, self.scan_memory_budget)
+        try:
+            if not self._saved_index_matches():
+                self.log("Real-time: Chưa có index, đang đối chiếu với thư mục đích...", level="info")
+                self.reconcile_file_index(table, backend)
+            with self.index_lock:
+                overlay = dict(self.index_overlay)
+            current = ((os.path.join(rel_dir, name), (size, mtime_ns))
+                       for rel_dir, name, size, mtime_ns, _ in table.iter_paths())
+            count = 0
+            for action, rel_path in diff_index(self._iter_file_index(overlay), current):
+                self.file_queue.put((action, os.path.join(src, rel_path)))
+                count += 1
+        finally:
+            table.close()
+        if count:
+            self.log(f"Real-time: Phát hiện {count} thay đổi khi ứng dụng tắt", level="info")
+
+    @property
+    def scan_memory_budget(self) -> int:
+        """Giới hạn bộ nhớ (byte) cho dữ liệu quét trước khi ghi tạm ra đĩa"""
+        return max(1, int(self.config.get("scan_memory_mb", 0))) * 1024 * 1024
+
+    def open_file_index(self, src: str, dst: str):
+        """Chọn index cho cặp thư mục; index của cặp khác được bỏ qua"""
+        with self.index_lock:
+            if self.index_pair != (src, dst):
+                self.index_overlay = {}
+            self.index_pair = (src, dst)
+
+    def _saved_index_matches(self) -> bool:
+        """INDEX_FILE có phải index của cặp thư mục hiện tại không"""
+        if self.index_pair is None or not os.path.exists(INDEX_FILE):
+            return False
+        try:
+            with open(INDEX_FILE, "r", encoding="utf-8") as f:
+                header = json.loads(f.readline() or "{}")
+        except (OSError, ValueError):
+            return False
+        return (header.get("src"), header.get("dst")) == self.index_pair
+
+    def _iter_saved_index(self):
+        """Đọc index đã lưu (JSON lines, sắp xếp theo path_key) theo luồng"""
+        if self.index_pair is None or not os.path.exists(INDEX_FILE):
+            return
+        try:
+            with open(INDEX_FILE, "r", encoding="utf-8") as f:
+                header = json.loads(f.readline() or "{}")
+                if (header.get("src"), header.get("dst")) != self.index_pair:
+                    return
+                for line in f:
+                    rel_path, size, mtime_ns = json.loads(line)
+                    yield rel_path, (size, mtime_ns)
+        except Exception as e:
+            self.log(f"Lỗi đọc index: {str(e)}", level="error")
+
+    def _iter_file_index(self, overlay: Dict[str, Optional[Tuple[int, int]]]):
+        """Index đã lưu gộp với các thay đổi chưa lưu, vẫn theo thứ tự path_key"""
+        pending = sorted(overlay.items(), key=lambda item: path_key(item[0]))
+        i = 0
+        for rel_path, stat in self._iter_saved_index():
+            key = path_key(rel_path)
+            while i < len(pending) and path_key(pending[i][0]) < key:
+                if pending[i][1] is not None:
+                    yield pending[i]
+                i += 1
+            if i < len(pending) and pending[i][0] == rel_path:
+                if pending[i][1] is not None:
+                    yield pending[i]
+                i += 1
+                continue
+            yield rel_path, stat
+        for rel_path, stat in pending[i:]:
+            if stat is not None:
+                yield rel_path, stat
+
+    def _write_index(self, entries):
+        """Ghi index (các cặp đường dẫn, (size, mtime_ns) theo thứ tự path_key) qua file tạm"""
+        src, dst = self.index_pair
+        tmp_file = INDEX_FILE + ".tmp"
+        try:
+            with open(tmp_file, "w", encoding="utf-8") as f:
+                f.write(json.dumps({"src": src, "dst": dst}) + "\n")
+                for rel_path, (size, mtime_ns) in entries:
+                    f.write(json.dumps([rel_path, size, mtime_ns]) + "\n")
+            os.replace(tmp_file, INDEX_FILE)
+        except BaseException:
+            if os.path.exists(tmp_file):
+                os.remove(tmp_file)
+            raise
+
+    def save_file_index(self):
+        """Lưu index file đã đồng bộ (ghi lại theo luồng, không nạp toàn bộ vào RAM)"""
+        if self.index_pair is None:
+            return
+        with self.index_write_lock:
+            with self.index_lock:
+                overlay = self.index_overlay
+                self.index_overlay = {}
+            self.index_saved_at = time.monotonic()
+            try:
+                self._write_index(self._iter_file_index(overlay))
+            except Exception as e:
+                self.log(f"Lỗi lưu index: {str(e)}", level="error")
+                with self.index_lock:
+                    overlay.update(self.index_overlay)
+                    self.index_overlay = overlay
+
+    def reconcile_file_index(self, table: FileTable, backend: StorageBackend):
+        """Dựng lại index đã lưu từ bảng quét nguồn và danh sách file ở đích.
+
+        Chỉ file có cùng (size, mtime_ns) ở hai bên được ghi vào index; file
+        còn lại sẽ được real-time xử lý ở lần bắt kịp sau. Thay đổi chưa lưu
+        trong index_overlay được giữ nguyên và vẫn áp lên index mới.
+        """
+        if self.index_pair is None:
+            return
+        with self.index_write_lock:
+            try:
+                self._write_index(self._iter_synced_files(table, backend))
+            except Exception as e:
+                self.log(f"Lỗi dựng index: {str(e)}", level="error")
+
+    @staticmethod
+    def _iter_synced_files(table: FileTable, backend: StorageBackend):
+        """Các file trong bảng quét có cùng (size, mtime_ns) ở đích; đích được liệt kê theo lô thư mục"""
+        rows, dirs = [], []  # các dòng chờ danh sách đích, thư mục của chúng theo thứ tự
+        
+        def flush():
+            listings = dict(zip(dirs, backend.list_dirs(dirs)))
+            for rel_dir, name, stat in rows:
+                listing = listings[rel_dir]
+                if not isinstance(listing, OSError) and listing[0].get(name) == stat:
+                    yield os.path.join(rel_dir, name), stat
+            rows.clear()
+            dirs.clear()
+            
+        for rel_dir, name, size, mtime_ns, _ in table.iter_paths():
+            if not dirs or dirs[-1] != rel_dir:
+                if len(dirs) >= REMOTE_LIST_BATCH:
+                    yield from flush()
+                dirs.append(rel_dir)
+            rows.append((rel_dir, name, (size, mtime_ns)))
+        if dirs:
+            yield from flush()
+
+    def refresh_file_index(self, src: str, dst: str):
+        """Làm mới index sau một lần đồng bộ thủ công để real-time không copy lại cả cây"""
+        if self.observer is not None and self.index_pair != (src, dst):
+            return  # real-time đang dùng index của cặp thư mục khác
+        self.open_file_index(src, dst)
+        backend = self.make_backend(dst)
+        table = scan_tree(src, self.scan_memory_budget)
+        try:
+            self.reconcile_file_index(table, backend)
+        finally:
+            table.close()
+            backend.close()
+
     def stop_realtime_sync(self):
         """Dừng đồng bộ real-time"""
-        if hasattr(self, 'observer'):
+        if self.observer is not None:
             self.observer.stop()
             self.observer.join()
+            self.observer = None
+            self.save_file_index()
             self.log("Đã tắt đồng bộ real-time", level="info")
+        if self.realtime_backend is not None:
+            self.realtime_backend.close()
+            self.realtime_backend = None
 
     def process_queue(self):
         """Xử lý hàng đợi thay đổi file (real-time)"""
         while True:
-            action, file_path = self.file_queue.get()
-            if not all([self.src_entry.get(), self.dst_entry.get()]):
+            try:
+                item = self.file_queue.get(timeout=INDEX_SAVE_INTERVAL)
+            except Empty:
+                item = None
+            # Ghi định kỳ các thay đổi chưa lưu để index_overlay không phình to
+            if self.index_overlay and (item is None or len(self.index_overlay) >= INDEX_OVERLAY_MAX
+                                       or time.monotonic() - self.index_saved_at >= INDEX_SAVE_INTERVAL):
+                self.save_file_index()
+            if item is None:
+                continue
+            action, file_path = item
+            backend = self.realtime_backend
+            if backend is None or not all([self.src_entry.get(), self.dst_entry.get()]):
                 continue
                 
             rel_path = os.path.relpath(file_path, self.src_entry.get())
-            dst_path = os.path.join(self.dst_entry.get(), rel_path)
             
             try:
                 if action in ('modified', 'created'):
-                    if self.should_sync_file(file_path, dst_path):
-                        if self.encryption_enabled.get():
-                            self.encrypt_file(file_path, dst_path)
-                        else:
-                            shutil.copy2(file_path, dst_path)
+                    if not os.path.isfile(file_path):
+                        continue
+                    st = os.stat(file_path)
+                    if self.should_sync_file(file_path, rel_path, backend):
+                        key = ENCRYPTION_KEY if self.encryption_enabled.get() else None
+                        backend.put_file(file_path, rel_path, key).result()
                         self.log(f"Real-time: Đã cập nhật {rel_path}", level="info")
+                    with self.index_lock:
+                        self.index_overlay[rel_path] = (st.st_size, st.st_mtime_ns)
                 elif action == 'deleted':
-                    if os.path.exists(dst_path):
-                        os.remove(dst_path)
+                    if backend.remove(rel_path).result():
                         self.log(f"Real-time: Đã xóa {rel_path}", level="info")
+                    # Chỉ ghi nhận sau khi xóa thành công; lỗi sẽ được thử lại ở lần bắt kịp sau
+                    with self.index_lock:
+                        self.index_overlay[rel_path] = None
             except Exception as e:
                 self.log(f"Lỗi real-time {action} {rel_path}: {str(e)}", level="error")
 
-    def start_sync(self):
-        """Bắt đầu quá trình đồng bộ"""
-        if self.sync_running:
-            messagebox.showinfo("Thông báo", "Đồng bộ đang chạy")
-            return
-            
+    def _get_sync_paths(self) -> Optional[Tuple[str, str]]:
+        """Lấy và kiểm tra thư mục nguồn/đích, báo lỗi nếu không hợp lệ"""
         src = self.src_entry.get()
         dst = self.dst_entry.get()
         
         if not src or not dst:
             messagebox.showerror("Lỗi", "Vui lòng chọn cả thư mục nguồn và đích")
-            return
+            return None
             
-        if not os.path.exists(src) or not os.path.exists(dst):
+        if dst.startswith(REMOTE_SCHEME):
+            if self.bidirectional.get():
+                messagebox.showerror("Lỗi", "Đồng bộ 2 chiều chưa hỗ trợ đích từ xa")
+                return None
+        elif not os.path.exists(dst):
             messagebox.showerror("Lỗi", "Thư mục nguồn hoặc đích không tồn tại")
+            return None
+            
+        if not os.path.exists(src):
+            messagebox.showerror("Lỗi", "Thư mục nguồn hoặc đích không tồn tại")
+            return None
+        return src, dst
+
+    def preview_sync(self):
+        """Xem trước (dry-run) những gì sẽ được đồng bộ"""
+        if self.sync_running:
+            messagebox.showinfo("Thông báo", "Đồng bộ đang chạy")
             return
             
+        paths = self._get_sync_paths()
+        if paths is None:
+            return
+            
+        self.cpu_executor.configure(self.config["executor"], self.cpu_workers.get())
+        self.log(f"Đang lập kế hoạch đồng bộ từ {paths[0]} đến {paths[1]}...", level="info")
+        threading.Thread(
+            target=self._preview_worker,
+            args=(*paths, self.sync_mode.get(), self.bidirectional.get()),
+            daemon=True
+        ).start()
+
+    def _preview_worker(self, src: str, dst: str, mode: str, bidirectional: bool):
+        try:
+            summary = self.dry_run(src, dst, mode, bidirectional)
+            self.log(summary, level="info")
+            messagebox.showinfo("Xem trước", f"{summary}\n\nChi tiết: {os.path.abspath(PLAN_FILE)}")
+        except Exception as e:
+            self.log(f"Lỗi lập kế hoạch: {str(e)}", level="error")
+            messagebox.showerror("Lỗi", f"Lập kế hoạch thất bại: {str(e)}")
+
+    def start_sync(self):
+        """Bắt đầu quá trình đồng bộ"""
+        if self.sync_running:
+            messagebox.showinfo("Thông báo", "Đồng bộ đang chạy")
+            return
+            
+        paths = self._get_sync_paths()
+        if paths is None:
+            return
+        src, dst = paths
+            
         self.sync_running = True
         self.paused = False
         self.progress_value.set(0)
         self.progress_label.config(text="Tiến trình: 0%")
+        self.cpu_executor.configure(self.config["executor"], self.cpu_workers.get())
         self.log(f"Bắt đầu đồng bộ từ {src} đến {dst}", level="info")
         
         self.sync_thread = threading.Thread(
@@ -602,13 +2169,15 @@ class FolderSyncApp:
         """Đồng bộ thư mục chính"""
         try:
             # Đồng bộ chiều chính (src -> dst)
-            self._sync_one_way(src, dst, mode)
+            self._sync_one_way(src, dst, mode, delete_extra=self._delete_extra(mode, bidirectional))
             
             # Đồng bộ chiều ngược lại nếu được chọn
             if bidirectional:
                 self.log("Bắt đầu đồng bộ chiều ngược lại...", level="info")
                 self._sync_one_way(dst, src, mode)
                 
+            self.refresh_file_index(src, dst)
+
             self.log("Đồng bộ hoàn tất!", level="info")
             messagebox.showinfo("Thành công", "Đồng bộ hoàn tất")
         except Exception as e:
@@ -619,50 +2188,283 @@ class FolderSyncApp:
             self.progress_value.set(100)
             self.progress_label.config(text="Tiến trình: 100%")
 
-    def _sync_one_way(self, src: str, dst: str, mode: str):
+    def _delete_extra(self, mode: str, bidirectional: bool) -> bool:
+        """Có xóa file/thư mục ở đích không còn ở nguồn không (chỉ chế độ gương một chiều, phải bật)"""
+        return mode == "mirror" and not bidirectional and self.mirror_delete.get()
+
+    def _sync_one_way(self, src: str, dst: str, mode: str, delete_extra: bool = False):
         """Đồng bộ một chiều"""
-        total_files = 0
-        copied_files = 0
+        backend = self.make_backend(dst)
+        plan = None
+        try:
+            plan = self.build_plan(src, backend, mode, delete_extra)
+            self.log(plan.summary(self.expected_throughput(src, dst)), level="info")
+            self._execute_plan(plan, backend)
+        finally:
+            if plan is not None:
+                table = plan.table
+                self.log(
+                    f"Đã quét {len(table)} file, {len(table.dirs)} thư mục "
+                    f"(RAM {table.resident_bytes / 1024 / 1024:.1f} MB, "
+                    f"ghi tạm {table.spilled_bytes / 1024 / 1024:.1f} MB, "
+                    f"RSS cao nhất {peak_rss_mb():.0f} MB)",
+                    level="info"
+                )
+                plan.close()
+            backend.close()
+
+    def make_backend(self, dst: str) -> StorageBackend:
+        """Tạo backend cho đích: thư mục cục bộ hoặc máy chủ từ xa (tcp://host:port/...)"""
+        if dst.startswith(REMOTE_SCHEME):
+            return RemoteBackend(dst, self.config["remote_connections"], self.config["remote_token"])
+        return LocalBackend(dst, self.cpu_executor)
+
+    def build_plan(self, src: str, backend: StorageBackend, mode: str, delete_extra: bool = False,
+                   after_forward: bool = False) -> SyncPlan:
+        """Lập kế hoạch đồng bộ src -> backend mà không thay đổi file nào.
+
+        Thư mục đích được liệt kê theo lô (không stat từng file). Với
+        delete_extra, file ở đích không còn ở nguồn được đánh dấu xóa và thư
+        mục chỉ có ở đích được ghi vào plan.delete_dirs.
+
+        after_forward dùng cho dry-run chiều ngược của đồng bộ 2 chiều: src
+        được coi như đã nhận xong các file chiều thuận (backend -> src) copy sang.
+        """
+        plan = SyncPlan(src, backend.location, self.scan_memory_budget)
+        compares = deque()  # (future hash nguồn, future hash đích, dir_id, tên, size, mtime_ns)
         
-        # Tính tổng số file cần xử lý
-        for root, _, files in os.walk(src):
-            for file in files:
-                if self.should_include_file(file):
-                    total_files += 1
+        def collect(limit: int):
+            while len(compares) > limit:
+                src_hash, dst_hash, dir_id, name, size, mtime_ns = compares.popleft()
+                try:
+                    action = PLAN_UPDATE if src_hash.result() != dst_hash.result() else PLAN_SKIP
+                except Exception as e:
+                    self.log(f"Lỗi khi tính hash {name}: {str(e)}", level="error")
+                    action = PLAN_SKIP
+                plan.add(dir_id, name, size, mtime_ns, action)
+        
+        stack = [('', 0, True)]  # (thư mục tương đối, dir_id, có ở nguồn)
+        while stack:
+            batch = [stack.pop() for _ in range(min(len(stack), REMOTE_LIST_BATCH))]
+            dst_listings = backend.list_dirs([rel_dir for rel_dir, _, _ in batch])
+            for (rel_dir, dir_id, in_src), dst_listing in zip(batch, dst_listings):
+                try:
+                    if isinstance(dst_listing, OSError):
+                        raise dst_listing
+                    dst_files, dst_dirs = dst_listing
+                    src_files, src_dirs = _list_dir_stats(os.path.join(src, rel_dir)) if in_src else ({}, set())
+                except OSError as e:
+                    self.log(f"Không đọc được thư mục {rel_dir}: {str(e)}", level="error")
+                    continue
+                identical = set()  # file giống hệt ở hai bên sau chiều thuận
+                if after_forward:
+                    src_files, identical = self._simulate_forward(src_files, dst_files, mode)
+                    src_dirs = src_dirs | dst_dirs
+                    
+                for name in sorted(src_files):
+                    if not self.should_include_file(name):
+                        continue
+                    size, mtime_ns = src_files[name]
+                    dst_stat = dst_files.get(name)
+                    if dst_stat is None:
+                        action = PLAN_COPY
+                    elif name in identical:
+                        # Gương vẫn ghi đè file đã có; các chế độ khác thấy hai bản như nhau
+                        action = PLAN_UPDATE if mode == "mirror" else PLAN_SKIP
+                    elif mode == "mirror":
+                        action = PLAN_UPDATE
+                    elif mode == "update":
+                        action = PLAN_UPDATE if mtime_ns > dst_stat[1] else PLAN_SKIP
+                    elif mode == "strict" and size != dst_stat[0]:
+                        action = PLAN_UPDATE
+                    elif mode == "strict":
+                        # So sánh hash chạy song song (pool tiến trình / máy chủ đích)
+                        src_hash = self.cpu_executor.submit(_file_hash_worker, os.path.join(src, rel_dir, name))
+                        dst_hash = backend.file_hash(os.path.join(rel_dir, name))
+                        compares.append((src_hash, dst_hash, dir_id, name, size, mtime_ns))
+                        collect(self.cpu_executor.max_inflight)
+                        continue
+                    else:
+                        action = PLAN_SKIP
+                    plan.add(dir_id, name, size, mtime_ns, action)
+                    
+                if delete_extra:
+                    for name in sorted(dst_files):
+                        if name not in src_files and self.should_include_file(name):
+                            size, mtime_ns = dst_files[name]
+                            plan.add(dir_id, name, size, mtime_ns, PLAN_DELETE)
+                            
+                subdirs = src_dirs | dst_dirs if delete_extra else src_dirs
+                for name in sorted(subdirs, reverse=True):
+                    sub_id = plan.table.add_dir(name, dir_id)
+                    if name not in src_dirs:
+                        plan.delete_dirs.append(sub_id)
+                    stack.append((os.path.join(rel_dir, name), sub_id, name in src_dirs))
         
-        if total_files == 0:
+        collect(0)
+        return plan
+
+    def _simulate_forward(self, files: Dict[str, Tuple[int, int]], forward_files: Dict[str, Tuple[int, int]],
+                          mode: str) -> Tuple[Dict[str, Tuple[int, int]], set]:
+        """Nội dung thư mục files sau khi chiều thuận copy forward_files sang.
+
+        Trả về (files mới, tên các file sẽ giống hệt bản bên kia). Ở chế độ
+        strict mọi file có ở cả hai bên đều giống hệt sau chiều thuận.
+        """
+        files = dict(files)
+        identical = set()
+        for name, stat in forward_files.items():
+            if not self.should_include_file(name):
+                continue
+            old_stat = files.get(name)
+            if old_stat is None or mode in ("mirror", "strict") or (mode == "update" and stat[1] > old_stat[1]):
+                files[name] = stat
+                identical.add(name)
+        return files, identical
+
+    def _execute_plan(self, plan: SyncPlan, backend: StorageBackend):
+        """Thực hiện kế hoạch đồng bộ, tiến trình tính theo byte"""
+        src, dst = plan.src, plan.dst
+        if plan.counts[PLAN_COPY] + plan.counts[PLAN_UPDATE] + plan.counts[PLAN_DELETE] == 0 \
+                and not plan.delete_dirs:
             self.log("Không có file nào để đồng bộ", level="warning")
             return
             
-        # Bắt đầu đồng bộ
-        for root, dirs, files in os.walk(src):
-            # Tạo thư mục tương ứng ở đích
-            rel_path = os.path.relpath(root, src)
-            dest_dir = os.path.join(dst, rel_path)
-            os.makedirs(dest_dir, exist_ok=True)
+        key = ENCRYPTION_KEY if self.encryption_enabled.get() else None
+        pending = deque()  # (future, hành động, đường dẫn tương đối, size, số byte đã báo)
+        
+        def collect(limit: int):
+            """Thu kết quả các tác vụ đã gửi cho tới khi còn <= limit tác vụ"""
+            while len(pending) > limit:
+                future, action, rel_path, size, reported = pending.popleft()
+                file = os.path.basename(rel_path)
+                try:
+                    result = future.result()
+                    if action == PLAN_DELETE and result:
+                        self.log(f"Đã xóa {rel_path}", level="info")
+                except Exception as e:
+                    if action == PLAN_DELETE:
+                        self.log(f"Lỗi khi xóa {file}: {str(e)}", level="error")
+                    else:
+                        self.log(f"Lỗi khi copy {file}: {str(e)}", level="error")
+                if action != PLAN_DELETE:
+                    # Phần chưa báo (mã hóa trong pool, file lỗi...) được tính khi tác vụ kết thúc
+                    progress.advance(max(0, size - reported[0]))
+                    self._report_progress(progress, file)
+        
+        def bytes_callback(file: str, reported: List[int]):
+            def on_bytes(n: int):
+                reported[0] += n
+                progress.advance(n)
+                self._report_progress(progress, file)
+                self._wait_while_paused(progress)
+            return on_bytes
             
-            for file in files:
-                while self.paused:
-                    time.sleep(0.5)
-                
-                if not self.should_include_file(file):
-                    continue
-                    
-                src_file = os.path.join(root, file)
-                dst_file = os.path.join(dest_dir, file)
+        # Tạo các thư mục tương ứng ở đích
+        delete_dirs = set(plan.delete_dirs)
+        dir_futures = deque()
+        for dir_id, node in enumerate(plan.table.dirs):
+            if dir_id in delete_dirs:
+                continue
+            dir_futures.append(backend.makedirs(node.rel_path()))
+            if len(dir_futures) > backend.max_inflight:
+                dir_futures.popleft().result()
+        for future in dir_futures:
+            future.result()
+        
+        # Bắt đầu đồng bộ; tốc độ chỉ đo thời gian chuyển file (không tính tạo/xóa thư mục)
+        progress = TransferProgress(plan.transfer_bytes, self.expected_throughput(src, dst))
+        for rel_dir, file, size, _, action in plan.table.iter_paths():
+            if action == PLAN_SKIP:
+                continue
+            self._wait_while_paused(progress)
                 
-                if self.should_sync_file(src_file, dst_file, mode):
-                    try:
-                        if self.encryption_enabled.get():
-                            self.encrypt_file(src_file, dst_file)
-                        else:
-                            shutil.copy2(src_file, dst_file)
-                            
-                        copied_files += 1
-                        progress = (copied_files / total_files) * 100
-                        self.update_progress(progress, file)
-                    except Exception as e:
-                        self.log(f"Lỗi khi copy {file}: {str(e)}", level="error")
+            rel_path = os.path.join(rel_dir, file)
+            reported = [0]
+            if action == PLAN_DELETE:
+                future = backend.remove(rel_path)
+            else:
+                future = backend.put_file(os.path.join(src, rel_path), rel_path, key,
+                                          bytes_callback(file, reported))
+            pending.append((future, action, rel_path, size, reported))
+            collect(backend.max_inflight)
+        
+        collect(0)
+        transfer_time = progress.elapsed
+        
+        # Xóa thư mục chỉ có ở đích, con trước cha; thư mục còn file (bị lọc) được giữ lại
+        for dir_id in reversed(plan.delete_dirs):
+            rel_dir = plan.table.dirs[dir_id].rel_path()
+            try:
+                if backend.remove_dir(rel_dir).result():
+                    self.log(f"Đã xóa thư mục {rel_dir}", level="info")
+            except Exception as e:
+                self.log(f"Lỗi khi xóa thư mục {rel_dir}: {str(e)}", level="error")
+        
+        self._report_progress(progress, force=True)
+        self.record_throughput(src, dst, progress.done_bytes, transfer_time)
+
+    def dry_run(self, src: str, dst: str, mode: str, bidirectional: bool = False) -> str:
+        """Lập kế hoạch đồng bộ (không thay đổi file), ghi chi tiết ra PLAN_FILE và trả về tóm tắt"""
+        passes = [(src, dst, self._delete_extra(mode, bidirectional), False)]
+        if bidirectional:
+            # Chiều ngược được lập trên trạng thái sau khi chiều thuận chạy xong
+            passes.append((dst, src, False, True))
+            
+        summaries = []
+        with open(PLAN_FILE, "w", encoding="utf-8") as f:
+            for pass_src, pass_dst, delete_extra, after_forward in passes:
+                backend = self.make_backend(pass_dst)
+                try:
+                    plan = self.build_plan(pass_src, backend, mode, delete_extra, after_forward)
+                finally:
+                    backend.close()
+                try:
+                    summary = plan.summary(self.expected_throughput(pass_src, pass_dst))
+                    summaries.append(summary)
+                    f.write(summary + "\n")
+                    for rel_dir, name, size, _, action in plan.table.iter_paths():
+                        f.write(f"{PLAN_ACTIONS[action]}\t{size}\t{os.path.join(rel_dir, name)}\n")
+                    for dir_id in plan.delete_dirs:
+                        f.write(f"Xóa thư mục\t0\t{plan.table.dirs[dir_id].rel_path()}\n")
+                    f.write("\n")
+                finally:
+                    plan.close()
+        return "\n".join(summaries)
+
+    def expected_throughput(self, src: str, dst: str) -> float:
+        """Tốc độ (byte/giây) đo được ở các lần đồng bộ trước cho cặp thư mục, 0 nếu chưa có"""
+        return self._load_throughput().get(f"{src} -> {dst}", 0.0)
+
+    def record_throughput(self, src: str, dst: str, nbytes: int, seconds: float):
+        """Cập nhật tốc độ đo được cho cặp thư mục (trung bình trượt giữa các lần chạy).
+
+        Lần chạy quá nhỏ (dưới THROUGHPUT_MIN_BYTES hoặc THROUGHPUT_MIN_SECONDS)
+        bị bỏ qua vì thời gian chủ yếu là chi phí cố định, không phải tốc độ truyền.
+        """
+        if nbytes < THROUGHPUT_MIN_BYTES or seconds < THROUGHPUT_MIN_SECONDS:
+            return
+        data = self._load_throughput()
+        pair = f"{src} -> {dst}"
+        rate = nbytes / seconds
+        if data.get(pair, 0) > 0:
+            rate = THROUGHPUT_SMOOTHING * rate + (1 - THROUGHPUT_SMOOTHING) * data[pair]
+        data[pair] = rate
+        try:
+            with open(THROUGHPUT_FILE, "w", encoding="utf-8") as f:
+                json.dump(data, f, indent=4)
+        except Exception as e:
+            self.log(f"Lỗi lưu tốc độ đồng bộ: {str(e)}", level="error")
+
+    def _load_throughput(self) -> Dict[str, float]:
+        if not os.path.exists(THROUGHPUT_FILE):
+            return {}
+        try:
+            with open(THROUGHPUT_FILE, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except Exception as e:
+            self.log(f"Lỗi đọc tốc độ đồng bộ: {str(e)}", level="error")
+            return {}
 
     def should_include_file(self, filename: str) -> bool:
         """Kiểm tra file có phù hợp với bộ lọc không"""
@@ -673,54 +2475,59 @@ class FolderSyncApp:
         ext = os.path.splitext(filename)[1].lower()
         return ext in self.file_filters.get(current_filter, [])
 
-    def should_sync_file(self, src: str, dst: str, mode: str = None) -> bool:
-        """Xác định có cần đồng bộ file không"""
+    def should_sync_file(self, src: str, rel_path: str, backend: StorageBackend, mode: str = None) -> bool:
+        """Xác định có cần đồng bộ file src tới rel_path trên backend đích không"""
         if mode is None:
             mode = self.sync_mode.get()
             
-        if not os.path.exists(dst):
+        dst_stat = backend.stat(rel_path)
+        if dst_stat is None:
             return True
             
         if mode == "mirror":
             return True
         elif mode == "update":
-            return os.path.getmtime(src) > os.path.getmtime(dst)
+            return os.stat(src).st_mtime_ns > dst_stat[1]
         elif mode == "add":
             return False
         elif mode == "strict":
-            return self.get_file_hash(src) != self.get_file_hash(dst)
+            return self.get_file_hash(src) != backend.file_hash(rel_path).result()
         return False
 
     def get_file_hash(self, filepath: str) -> str:
         """Tính toán hash MD5 của file"""
-        hash_md5 = hashlib.md5()
         try:
-            with open(filepath, "rb") as f:
-                for chunk in iter(lambda: f.read(4096), b""):
-                    hash_md5.update(chunk)
-            return hash_md5.hexdigest()
+            return self.cpu_executor.submit(_file_hash_worker, filepath).result()
         except Exception as e:
             self.log(f"Lỗi khi tính hash {filepath}: {str(e)}", level="error")
             return ""
 
-    def encrypt_file(self, src: str, dst: str):
-        """Mã hóa file (ví dụ đơn giản)"""
-        # Trong thực tế nên dùng thư viện như cryptography
-        try:
-            with open(src, 'rb') as f_src, open(dst, 'wb') as f_dst:
-                key = 0x55  # Trong thực tế nên dùng key từ file
-                for byte in f_src.read():
-                    f_dst.write(bytes([byte ^ key]))
-        except Exception as e:
-            self.log(f"Lỗi mã hóa {src}: {str(e)}", level="error")
-            raise
-
-    def update_progress(self, progress: float, filename: str = ""):
+    def update_progress(self, progress: float, filename: str = "", eta: Optional[float] = None):
         """Cập nhật tiến trình đồng bộ"""
+        text = f"Tiến trình: {int(progress)}% - {filename}"
+        if eta is not None:
+            text += f" - còn {format_duration(eta)}"
         self.progress_value.set(progress)
-        self.progress_label.config(text=f"Tiến trình: {int(progress)}% - {filename}")
+        self.progress_label.config(text=text)
         self.root.update_idletasks()
 
+    def _wait_while_paused(self, progress: TransferProgress):
+        """Chờ khi đang tạm dừng; thời gian chờ không tính vào tốc độ đo được"""
+        if not self.paused:
+            return
+        started = time.monotonic()
+        while self.paused:
+            time.sleep(0.5)
+        progress.add_paused(time.monotonic() - started)
+
+    def _report_progress(self, progress: TransferProgress, filename: str = "", force: bool = False):
+        """Cập nhật thanh tiến trình theo byte, giới hạn tần suất vẽ lại giao diện"""
+        now = time.monotonic()
+        if not force and now - self.last_progress_refresh < PROGRESS_REFRESH_INTERVAL:
+            return
+        self.last_progress_refresh = now
+        self.update_progress(progress.percent, filename, progress.eta)
+
     def start_auto_sync(self):
         """Tự động đồng bộ theo chu kỳ"""
         def sync_loop():
@@ -757,9 +2564,41 @@ class FolderSyncApp:
         """Xử lý khi đóng ứng dụng"""
         self.stop_realtime_sync()
         self.save_config()
+        self.cpu_executor.shutdown()
         self.root.destroy()
 
+def _is_loopback(host: str) -> bool:
+    """Địa chỉ chỉ nghe trên máy cục bộ"""
+    if host.lower() == "localhost":
+        return True
+    try:
+        return ipaddress.ip_address(host).is_loopback
+    except ValueError:
+        return False
+
+def serve(argv: List[str]):
+    """Chạy máy chủ lưu trữ cho đích từ xa: main.py --serve THƯ_MỤC [--host H] [--port P] [--token T]"""
+    parser = argparse.ArgumentParser(prog="main.py --serve")
+    parser.add_argument("root")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=REMOTE_PORT)
+    parser.add_argument("--token", default="")
+    args = parser.parse_args(argv)
+    
+    token = args.token
+    if not token and not _is_loopback(args.host):
+        # Không bao giờ mở ra mạng mà không có token
+        token = secrets.token_hex(16)
+        print(f"Chưa đặt --token, dùng token ngẫu nhiên: {token}")
+    with StorageServer(args.root, args.host, args.port, token) as server:
+        print(f"FolderSync server: {server.root} tại {args.host}:{server.server_address[1]}")
+        server.serve_forever()
+
 if __name__ == "__main__":
+    multiprocessing.freeze_support()
+    if len(sys.argv) > 1 and sys.argv[1] == "--serve":
+        serve(sys.argv[2:])
+        sys.exit(0)
     root = tk.Tk()
     app = FolderSyncApp(root)
     root.protocol("WM_DELETE_WINDOW", app.on_closing)
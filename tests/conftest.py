@@ -0,0 +1,65 @@
+import os
+import sys
+import threading
+import time
+from queue import Queue
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import main  # noqa: E402
+
+
+class Var:
+    """Thay cho tk.*Var khi không có cửa sổ Tk"""
+    def __init__(self, value):
+        self.value = value
+
+    def get(self):
+        return self.value
+
+    def set(self, value):
+        self.value = value
+
+
+class Label:
+    def config(self, **kwargs):
+        pass
+
+
+@pytest.fixture
+def app(tmp_path, monkeypatch):
+    """FolderSyncApp không có giao diện; file index/plan/tốc độ nằm trong tmp_path"""
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(main.messagebox, "showinfo", lambda *args: None)
+    monkeypatch.setattr(main.messagebox, "showerror", lambda *args: None)
+    app = main.FolderSyncApp.__new__(main.FolderSyncApp)
+    app.paused = False
+    app.sync_running = False
+    app.observer = None
+    app.realtime_backend = None
+    app.file_queue = Queue(maxsize=main.REALTIME_QUEUE_SIZE)
+    app.index_overlay = {}
+    app.index_pair = None
+    app.index_lock = threading.Lock()
+    app.index_write_lock = threading.Lock()
+    app.index_saved_at = time.monotonic()
+    app.last_progress_refresh = 0.0
+    app.config = {"executor": "inline", "scan_memory_mb": 1, "remote_connections": 2, "remote_token": ""}
+    app.cpu_executor = main.CpuExecutor("inline", 1)
+    app.current_filter = Var('all')
+    app.file_filters = {'all': [], 'documents': ['.txt']}
+    app.sync_mode = Var("mirror")
+    app.encryption_enabled = Var(False)
+    app.mirror_delete = Var(False)
+    app.bidirectional = Var(False)
+    app.src_entry = Var("")
+    app.dst_entry = Var("")
+    app.logs = []
+    app.log = lambda message, level="info": app.logs.append((level, message))
+    app.progress_value = Var(0)
+    app.progress_label = Label()
+    app.update_progress = lambda *args: None
+    yield app
+    app.cpu_executor.shutdown()
@@ -0,0 +1,71 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import main  # noqa: E402
+
+
+@pytest.fixture
+def small_chunks(monkeypatch):
+    monkeypatch.setattr(main.FileTable, "CHUNK_ROWS", 4)
+
+
+def fill(table, rows):
+    dir_ids = {'': 0}
+    for rel_dir, name, size, mtime_ns in rows:
+        if rel_dir not in dir_ids:
+            parent, _, base = rel_dir.rpartition(os.sep)
+            dir_ids[rel_dir] = table.add_dir(base, dir_ids[parent])
+        table.append(dir_ids[rel_dir], name, size, mtime_ns)
+
+
+def test_spill_and_read_back(small_chunks):
+    rows = [(os.path.join('a', 'b') if i % 3 else 'a', f"tệp_{i:03d}.txt", i * 10, 1_000 + i)
+            for i in range(50)]
+    rows.sort(key=lambda row: row[0])
+    table = main.FileTable(memory_budget=1)
+    try:
+        fill(table, rows)
+        assert len(table) == 50
+        assert table.spilled_bytes > 0
+        # Chỉ khối đang ghi dở còn trong RAM
+        assert table.resident_bytes <= table._chunk_nbytes(table._current)
+        assert [(rel_dir, name, size, mtime_ns) for rel_dir, name, size, mtime_ns, _ in table.iter_paths()] == rows
+        # Đọc lại nhiều lần vẫn cho cùng kết quả
+        assert len(list(table)) == 50
+    finally:
+        table.close()
+
+
+def test_no_spill_within_budget(small_chunks):
+    table = main.FileTable()
+    fill(table, [('', f"f{i}", i, i) for i in range(10)])
+    assert table.spilled_bytes == 0
+    assert [row[1] for row in table] == [f"f{i}" for i in range(10)]
+    table.close()
+    assert table.resident_bytes == 0
+
+
+def test_undecodable_names_round_trip(small_chunks):
+    name = os.fsdecode(b'bad\xffname') if os.name != 'nt' else 'tên\ud800'
+    table = main.FileTable(memory_budget=1)
+    fill(table, [('', name, 1, 2)] * 9)
+    assert {row[1] for row in table} == {name}
+    table.close()
+
+
+def test_scan_tree_is_sorted_by_path_key(tmp_path, small_chunks):
+    for rel in ['b.txt', 'a/z.txt', 'a/c/d.txt', 'a/a.txt', 'ab/x.txt', 'c.log']:
+        path = tmp_path / rel
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(rel)
+    table = main.scan_tree(str(tmp_path), memory_budget=1, include=lambda name: name.endswith('.txt'))
+    try:
+        paths = [os.path.join(rel_dir, name) for rel_dir, name, _, _, _ in table.iter_paths()]
+    finally:
+        table.close()
+    assert paths == sorted(paths, key=main.path_key)
+    assert sorted(paths) == sorted(os.path.normpath(p) for p in ['b.txt', 'a/z.txt', 'a/c/d.txt', 'a/a.txt', 'ab/x.txt'])
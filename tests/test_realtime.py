@@ -0,0 +1,223 @@
+import errno
+import os
+import shutil
+import sys
+import time
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import main  # noqa: E402
+
+
+def write(path, data="x", mtime_ns=None):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w") as f:
+        f.write(data)
+    if mtime_ns is not None:
+        os.utime(path, ns=(mtime_ns, mtime_ns))
+
+
+def drain(queue):
+    events = []
+    while not queue.empty():
+        events.append(queue.get())
+    return events
+
+
+def sorted_entries(entries):
+    return sorted(entries, key=lambda entry: main.path_key(entry[0]))
+
+
+# --- diff_index / index overlay ---------------------------------------------
+
+def test_diff_index():
+    old = sorted_entries([("a.txt", (1, 1)), ("b.txt", (1, 1)), (os.path.join("d", "c.txt"), (1, 1))])
+    new = sorted_entries([("a.txt", (2, 1)), (os.path.join("d", "c.txt"), (1, 1)),
+                          (os.path.join("d", "e", "f.txt"), (1, 1)), ("z.txt", (1, 1))])
+    assert sorted(main.diff_index(iter(old), iter(new))) == sorted([
+        ('modified', "a.txt"),
+        ('deleted', "b.txt"),
+        ('created', os.path.join("d", "e", "f.txt")),
+        ('created', "z.txt"),
+    ])
+
+
+def test_diff_index_empty_sides():
+    rows = [("a.txt", (1, 1))]
+    assert list(main.diff_index(iter([]), iter(rows))) == [('created', "a.txt")]
+    assert list(main.diff_index(iter(rows), iter([]))) == [('deleted', "a.txt")]
+
+
+def test_overlay_merge_with_saved_index(app):
+    app.open_file_index("src", "dst")
+    saved = sorted_entries([("b.txt", (1, 1)), ("d.txt", (1, 1)), (os.path.join("sub", "f.txt"), (1, 1))])
+    app._write_index(iter(saved))
+    overlay = {
+        "a.txt": (9, 9),                        # chèn trước dòng đầu
+        "c.txt": (9, 9),                        # chèn giữa hai dòng đã lưu
+        "d.txt": None,                          # xóa dòng đã lưu
+        "b.txt": (2, 2),                        # sửa dòng đã lưu
+        os.path.join("sub", "g.txt"): (9, 9),   # chèn sau dòng cuối
+        "missing.txt": None,                    # xóa dòng không có
+    }
+    assert list(app._iter_file_index(overlay)) == sorted_entries([
+        ("a.txt", (9, 9)), ("b.txt", (2, 2)), ("c.txt", (9, 9)),
+        (os.path.join("sub", "f.txt"), (1, 1)), (os.path.join("sub", "g.txt"), (9, 9)),
+    ])
+
+
+def test_save_file_index_applies_overlay(app):
+    app.open_file_index("src", "dst")
+    app._write_index(iter([("a.txt", (1, 1))]))
+    app.index_overlay = {"a.txt": None, "b.txt": (2, 2)}
+    app.save_file_index()
+    assert app.index_overlay == {}
+    assert list(app._iter_saved_index()) == [("b.txt", (2, 2))]
+    # Index của cặp thư mục khác bị bỏ qua
+    app.open_file_index("src", "other")
+    assert list(app._iter_saved_index()) == []
+    assert not app._saved_index_matches()
+
+
+def test_catch_up_seeds_index_from_destination(app, tmp_path):
+    src, dst = str(tmp_path / "src"), str(tmp_path / "dst")
+    for i in range(5):
+        write(os.path.join(src, f"d{i % 2}", f"f{i}.txt"), str(i))
+    shutil.copytree(src, dst)  # copy2 giữ mtime
+    write(os.path.join(src, "d0", "f0.txt"), "changed")
+    write(os.path.join(src, "new.txt"))
+    app.open_file_index(src, dst)
+
+    app._realtime_catch_up(src, main.LocalBackend(dst, app.cpu_executor))
+
+    assert app._saved_index_matches()
+    assert sorted(drain(app.file_queue)) == [
+        ('created', os.path.join(src, "d0", "f0.txt")),
+        ('created', os.path.join(src, "new.txt")),
+    ]
+    # Lần sau dùng index đã có: không còn thay đổi nào ngoài 2 file trên
+    app.index_overlay = {os.path.join("d0", "f0.txt"): (7, 7)}
+    app._realtime_catch_up(src, main.LocalBackend(dst, app.cpu_executor))
+    assert sorted(action for action, _ in drain(app.file_queue)) == ['created', 'modified']
+
+
+def test_refresh_after_manual_sync_queues_nothing(app, tmp_path):
+    src, dst = str(tmp_path / "src"), str(tmp_path / "dst")
+    for i in range(5):
+        write(os.path.join(src, f"d{i % 2}", f"f{i}.txt"), str(i))
+    os.makedirs(dst)
+    app.sync_folders(src, dst, "mirror")
+    app._realtime_catch_up(src, main.LocalBackend(dst, app.cpu_executor))
+    assert drain(app.file_queue) == []
+
+
+def test_failed_realtime_delete_is_not_recorded(app, tmp_path):
+    src, dst = str(tmp_path / "src"), str(tmp_path / "dst")
+    os.makedirs(src)
+    os.makedirs(dst)
+    app.src_entry.set(src)
+    app.dst_entry.set(dst)
+
+    class FailingBackend(main.LocalBackend):
+        def remove(self, rel_path):
+            return main._run_to_future(os.remove, "/nonexistent/path")
+
+    app.realtime_backend = FailingBackend(dst, app.cpu_executor)
+    main.threading.Thread(target=app.process_queue, daemon=True).start()
+    app.file_queue.put(('deleted', os.path.join(src, "a.txt")))
+    deadline = time.monotonic() + 5
+    while not app.logs and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert app.logs and app.logs[0][0] == "error"
+    assert "a.txt" not in app.index_overlay
+
+    app.realtime_backend = main.LocalBackend(dst, app.cpu_executor)
+    app.file_queue.put(('deleted', os.path.join(src, "a.txt")))
+    while "a.txt" not in app.index_overlay and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert app.index_overlay["a.txt"] is None
+
+
+# --- PollingWatcher ---------------------------------------------------------
+
+@pytest.fixture
+def watcher(app, tmp_path):
+    root = tmp_path / "watched"
+    write(str(root / "a.txt"), "a")
+    write(str(root / "sub" / "b.txt"), "b")
+    write(str(root / "sub" / "deep" / "c.txt"), "c")
+    watcher = main.PollingWatcher(app, str(root))
+    watcher._add_tree('', emit=False)
+    return watcher
+
+
+def bump_mtime(path):
+    """Đổi mtime thư mục chắc chắn khác lần trước (độ phân giải mtime có thể thô)"""
+    st = os.stat(path)
+    os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns + 1_000_000_000))
+
+
+def events(app, watcher):
+    return sorted((action, os.path.relpath(path, watcher.root)) for action, path in drain(app.file_queue))
+
+
+def test_watcher_file_events(app, watcher):
+    root = watcher.root
+    write(os.path.join(root, "new.txt"))
+    os.remove(os.path.join(root, "a.txt"))
+    bump_mtime(root)
+    write(os.path.join(root, "sub", "b.txt"), "modified in place")
+    assert watcher._poll(full=False)
+    assert events(app, watcher) == [('created', "new.txt"), ('deleted', "a.txt")]
+    # Sửa tại chỗ không đổi mtime thư mục: chỉ thấy ở lần stat lại toàn bộ
+    assert watcher._poll(full=True)
+    assert events(app, watcher) == [('modified', os.path.join("sub", "b.txt"))]
+    assert not watcher._poll(full=True)
+
+
+def test_watcher_directory_events(app, watcher):
+    root = watcher.root
+    write(os.path.join(root, "newdir", "inner", "x.txt"))
+    shutil.rmtree(os.path.join(root, "sub"))
+    bump_mtime(root)
+    assert watcher._poll(full=False)
+    assert events(app, watcher) == [
+        ('created', os.path.join("newdir", "inner", "x.txt")),
+        ('deleted', os.path.join("sub", "b.txt")),
+        ('deleted', os.path.join("sub", "deep", "c.txt")),
+    ]
+    assert os.path.join("sub", "deep") not in watcher.dirs
+
+
+def test_watcher_keeps_state_on_transient_errors(app, watcher, monkeypatch):
+    root = watcher.root
+    list_dir = watcher._list_dir
+
+    def stale(rel_dir):
+        raise OSError(errno.ESTALE, "Stale file handle")
+    monkeypatch.setattr(watcher, "_list_dir", stale)
+    write(os.path.join(root, "sub", "new.txt"))
+    bump_mtime(os.path.join(root, "sub"))
+    assert not watcher._poll(full=False)
+    assert events(app, watcher) == []
+
+    # Thư mục gốc tạm thời biến mất (ổ mạng mất kết nối): không sinh sự kiện xóa
+    monkeypatch.setattr(watcher, "_list_dir", list_dir)
+    moved = root + ".offline"
+    os.rename(root, moved)
+    assert not watcher._poll(full=True)
+    os.rename(moved, root)
+    assert events(app, watcher) == []
+    assert '' in watcher.dirs
+
+    assert watcher._poll(full=False)
+    assert events(app, watcher) == [('created', os.path.join("sub", "new.txt"))]
+
+
+def test_watcher_snapshot_round_trip():
+    files = {"b.txt": (1, 2), "a.txt": (3, 4), os.fsdecode(b"\xff.bin"): (5, 6)}
+    packed = main.PollingWatcher._pack_files(files)
+    assert main.PollingWatcher._unpack_files(packed) == files
+    assert main.PollingWatcher._unpack_files(main.PollingWatcher._pack_files({})) == {}
@@ -0,0 +1,158 @@
+import os
+import socket
+import sys
+import threading
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import main  # noqa: E402
+
+TOKEN = "secret"
+
+
+@pytest.fixture
+def server(tmp_path):
+    root = tmp_path / "remote"
+    root.mkdir()
+    server = main.StorageServer(str(root), "127.0.0.1", 0, TOKEN)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+    thread.join(timeout=5)
+
+
+def backend_for(server, token=TOKEN, prefix="data"):
+    host, port = server.server_address
+    return main.RemoteBackend(f"tcp://{host}:{port}/{prefix}", connections=2, token=token)
+
+
+def raw_connection(server):
+    sock = socket.create_connection(server.server_address, timeout=5)
+    rfile = sock.makefile('rb')
+    main._send_msg(sock, {"op": "hello", "token": TOKEN})
+    assert main._recv_msg(rfile)["ok"]
+    return sock, rfile
+
+
+def test_put_list_hash_remove(server, tmp_path):
+    src = tmp_path / "a.txt"
+    src.write_bytes(b"hello world" * 1000)
+    os.utime(src, ns=(1_000_000_000, 1_000_000_000))
+    backend = backend_for(server)
+    try:
+        backend.makedirs("sub").result(timeout=5)
+        backend.put_file(str(src), os.path.join("sub", "a.txt")).result(timeout=5)
+
+        root_listing, sub_listing = backend.list_dirs(["", "sub"])
+        assert root_listing == ({}, {"sub"})
+        assert sub_listing == ({"a.txt": (src.stat().st_size, 1_000_000_000)}, set())
+        assert backend.stat(os.path.join("sub", "a.txt")) == (src.stat().st_size, 1_000_000_000)
+        assert backend.stat("missing.txt") is None
+
+        remote_hash = backend.file_hash(os.path.join("sub", "a.txt")).result(timeout=5)
+        assert remote_hash == main._file_hash_worker(str(src))
+
+        assert backend.remove(os.path.join("sub", "a.txt")).result(timeout=5) is True
+        assert backend.remove(os.path.join("sub", "a.txt")).result(timeout=5) is False
+        assert backend.remove_dir("sub").result(timeout=5) is True
+        assert os.listdir(os.path.join(server.root, "data")) == []
+    finally:
+        backend.close()
+
+
+def test_encrypted_put_matches_local_encryption(server, tmp_path):
+    src = tmp_path / "plain.bin"
+    src.write_bytes(bytes(range(256)) * 10)
+    local_copy = tmp_path / "local.bin"
+    main._encrypt_file_worker(str(src), str(local_copy))
+    backend = backend_for(server)
+    try:
+        backend.put_file(str(src), "enc.bin", key=main.ENCRYPTION_KEY).result(timeout=5)
+    finally:
+        backend.close()
+    with open(os.path.join(server.root, "data", "enc.bin"), 'rb') as f:
+        assert f.read() == local_copy.read_bytes()
+
+
+def test_per_directory_list_errors(server):
+    os.makedirs(os.path.join(server.root, "data"))
+    with open(os.path.join(server.root, "data", "x"), 'w') as f:
+        f.write("file, not a directory")
+    backend = backend_for(server)
+    try:
+        listings = backend.list_dirs(["", "x", "missing"])
+    finally:
+        backend.close()
+    assert listings[0] == ({"x": listings[0][0]["x"]}, set())
+    assert isinstance(listings[1], OSError)
+    assert listings[2] == ({}, set())
+
+
+def test_wrong_token_is_rejected(server):
+    with pytest.raises(OSError, match="Sai token"):
+        backend_for(server, token="wrong").list_dirs([""])
+
+
+def test_path_traversal_is_rejected(server, tmp_path):
+    src = tmp_path / "evil.txt"
+    src.write_text("x")
+    backend = backend_for(server, prefix="")
+    try:
+        with pytest.raises(OSError, match="không hợp lệ"):
+            backend.put_file(str(src), os.path.join("..", "evil.txt")).result(timeout=5)
+        with pytest.raises(OSError, match="không hợp lệ"):
+            backend.remove(os.path.join("..", "remote", "x")).result(timeout=5)
+        # Kết nối vẫn dùng được sau khi bị từ chối
+        assert backend.list_dirs([""]) == [({}, set())]
+    finally:
+        backend.close()
+    assert not (tmp_path / "evil.txt.foldersync-tmp").exists()
+    assert sorted(os.listdir(tmp_path)) == ["evil.txt", "remote"]
+
+
+def test_payload_abort_leaves_no_file(server, tmp_path):
+    backend = backend_for(server)
+    try:
+        with pytest.raises(FileNotFoundError):
+            backend.put_file(str(tmp_path / "missing.txt"), "a.txt").result(timeout=5)
+    finally:
+        backend.close()
+
+    sock, rfile = raw_connection(server)
+    try:
+        main._send_msg(sock, {"op": "put", "path": "data/partial.txt"})
+        chunk = b"partial data"
+        sock.sendall(main._MSG_LEN.pack(len(chunk)) + chunk)
+        sock.sendall(main._MSG_LEN.pack(main._PAYLOAD_ABORT))
+        response = main._recv_msg(rfile)
+        assert not response["ok"]
+
+        # Luồng dữ liệu vẫn đồng bộ: yêu cầu tiếp theo trên cùng kết nối vẫn đúng
+        main._send_msg(sock, {"op": "stat", "path": "data/partial.txt"})
+        assert main._recv_msg(rfile) == {"ok": True, "stat": None}
+    finally:
+        rfile.close()
+        sock.close()
+    assert os.listdir(os.path.join(server.root, "data")) == []
+
+
+@pytest.mark.parametrize("host, expected", [
+    ("127.0.0.1", True), ("localhost", True), ("::1", True),
+    ("0.0.0.0", False), ("192.168.1.5", False), ("example.com", False),
+])
+def test_is_loopback(host, expected):
+    assert main._is_loopback(host) is expected
+
+
+def test_oversized_header_closes_connection(server):
+    sock = socket.create_connection(server.server_address, timeout=5)
+    try:
+        # Độ dài vượt giới hạn trước khi xác thực: máy chủ phải đóng kết nối ngay
+        sock.sendall(main._MSG_LEN.pack(main.REMOTE_MAX_HEADER + 1))
+        assert sock.recv(1) == b""
+    finally:
+        sock.close()
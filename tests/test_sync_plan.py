@@ -0,0 +1,189 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import main  # noqa: E402
+
+OLD, NEW = 1_000_000_000_000_000_000, 2_000_000_000_000_000_000
+
+
+def write(path, data, mtime_ns=OLD):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w") as f:
+        f.write(data)
+    os.utime(path, ns=(mtime_ns, mtime_ns))
+
+
+@pytest.fixture
+def trees(tmp_path):
+    src, dst = str(tmp_path / "src"), str(tmp_path / "dst")
+    write(os.path.join(src, "only_src.txt"), "a")
+    write(os.path.join(src, "newdir", "x.txt"), "b")
+    write(os.path.join(dst, "only_dst.txt"), "c")
+    write(os.path.join(dst, "only_dst.log"), "c")
+    write(os.path.join(dst, "dstdir", "y.txt"), "d")
+    write(os.path.join(src, "src_newer.txt"), "111", NEW)
+    write(os.path.join(dst, "src_newer.txt"), "22")
+    write(os.path.join(src, "dst_newer.txt"), "111")
+    write(os.path.join(dst, "dst_newer.txt"), "22", NEW)
+    write(os.path.join(src, "same.txt"), "zz")
+    write(os.path.join(dst, "same.txt"), "zz")
+    write(os.path.join(src, "same_size.txt"), "ab")
+    write(os.path.join(dst, "same_size.txt"), "cd")
+    return src, dst
+
+
+def plan_rows(plan):
+    return {os.path.join(rel_dir, name): main.PLAN_ACTIONS[action]
+            for rel_dir, name, _, _, action in plan.table.iter_paths()}
+
+
+def build(app, src, dst, mode, delete_extra=False):
+    return app.build_plan(src, main.LocalBackend(dst, app.cpu_executor), mode, delete_extra)
+
+
+COPY, UPDATE, SKIP, DELETE = (main.PLAN_ACTIONS[a] for a in
+                              (main.PLAN_COPY, main.PLAN_UPDATE, main.PLAN_SKIP, main.PLAN_DELETE))
+
+
+@pytest.mark.parametrize("mode, expected", [
+    ("mirror", {"src_newer.txt": UPDATE, "dst_newer.txt": UPDATE, "same.txt": UPDATE, "same_size.txt": UPDATE}),
+    ("update", {"src_newer.txt": UPDATE, "dst_newer.txt": SKIP, "same.txt": SKIP, "same_size.txt": SKIP}),
+    ("strict", {"src_newer.txt": UPDATE, "dst_newer.txt": UPDATE, "same.txt": SKIP, "same_size.txt": UPDATE}),
+    ("add", {"src_newer.txt": SKIP, "dst_newer.txt": SKIP, "same.txt": SKIP, "same_size.txt": SKIP}),
+])
+def test_build_plan_actions(app, trees, mode, expected):
+    plan = build(app, *trees, mode)
+    try:
+        expected = dict(expected, **{"only_src.txt": COPY, os.path.join("newdir", "x.txt"): COPY})
+        assert plan_rows(plan) == expected
+        assert plan.counts[main.PLAN_DELETE] == 0 and plan.delete_dirs == []
+        assert plan.transfer_bytes == sum(
+            os.path.getsize(os.path.join(trees[0], rel)) for rel, action in expected.items() if action != SKIP)
+    finally:
+        plan.close()
+
+
+@pytest.mark.parametrize("mode, bidirectional, switch, expected", [
+    ("mirror", False, True, True),
+    ("mirror", False, False, False),
+    ("mirror", True, True, False),
+    ("update", False, True, False),
+])
+def test_delete_extra_is_opt_in(app, mode, bidirectional, switch, expected):
+    app.mirror_delete.set(switch)
+    assert app._delete_extra(mode, bidirectional) is expected
+
+
+def test_mirror_delete_plan_and_execute(app, trees):
+    src, dst = trees
+    app.current_filter.set('documents')  # .txt
+    plan = build(app, src, dst, "mirror", delete_extra=True)
+    try:
+        rows = plan_rows(plan)
+        assert rows["only_dst.txt"] == DELETE
+        assert rows[os.path.join("dstdir", "y.txt")] == DELETE
+        assert "only_dst.log" not in rows  # bị lọc: không xóa
+        assert [plan.table.dirs[d].rel_path() for d in plan.delete_dirs] == ["dstdir"]
+        app._execute_plan(plan, main.LocalBackend(dst, app.cpu_executor))
+    finally:
+        plan.close()
+    assert sorted(os.listdir(dst)) == sorted([
+        "only_src.txt", "newdir", "only_dst.log", "src_newer.txt", "dst_newer.txt", "same.txt", "same_size.txt"])
+
+
+def test_sync_without_switch_keeps_destination_extras(app, trees):
+    src, dst = trees
+    app.sync_folders(src, dst, "mirror")
+    assert os.path.exists(os.path.join(dst, "only_dst.txt"))
+    assert os.path.exists(os.path.join(dst, "dstdir", "y.txt"))
+
+
+@pytest.mark.parametrize("mode", ["mirror", "update", "strict", "add"])
+def test_dry_run_reverse_pass_matches_real_sync(app, trees, mode):
+    src, dst = trees
+    app.dry_run(src, dst, mode, bidirectional=True)
+    with open(main.PLAN_FILE, encoding="utf-8") as f:
+        reverse_section = f.read().split("\n\n")[1]
+    predicted = {line.split("\t")[2]: line.split("\t")[0]
+                 for line in reverse_section.splitlines() if line.count("\t") == 2}
+
+    app._sync_one_way(src, dst, mode)
+    plan = build(app, dst, src, mode)
+    try:
+        assert predicted == plan_rows(plan)
+    finally:
+        plan.close()
+
+
+# --- tiến trình / tốc độ ----------------------------------------------------
+
+class Clock:
+    def __init__(self):
+        self.now = 100.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_transfer_progress_eta_and_pause(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(main.time, "monotonic", clock)
+    progress = main.TransferProgress(1000)
+    assert progress.eta is None
+    clock.now += 1
+    progress.advance(100)
+    assert progress.rate == pytest.approx(100)
+    assert progress.eta == pytest.approx(9)
+    assert progress.percent == pytest.approx(10)
+
+    # 10 giây tạm dừng không làm giảm tốc độ đo được
+    clock.now += 10
+    progress.add_paused(10)
+    clock.now += 1
+    progress.advance(100)
+    assert progress.rate == pytest.approx(100)
+    assert progress.elapsed == pytest.approx(2)
+    assert progress.paused_time == pytest.approx(10)
+
+
+def test_transfer_progress_uses_initial_rate(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(main.time, "monotonic", clock)
+    progress = main.TransferProgress(1000, initial_rate=50)
+    assert progress.eta == pytest.approx(20)
+    clock.now += 1
+    progress.advance(200)
+    # Trung bình trượt giữa tốc độ đã lưu và tốc độ mới đo
+    assert progress.rate == pytest.approx(main.ETA_SMOOTHING * 200 + (1 - main.ETA_SMOOTHING) * 50)
+
+
+def test_record_throughput_ignores_tiny_runs(app):
+    app.record_throughput("a", "b", 2048, 0.04)
+    app.record_throughput("a", "b", 100 * 1024 * 1024, 0.5)
+    assert app.expected_throughput("a", "b") == 0
+    app.record_throughput("a", "b", 100 * 1024 * 1024, 2.0)
+    assert app.expected_throughput("a", "b") == pytest.approx(50 * 1024 * 1024)
+
+
+def test_large_encrypted_file_reports_progress_per_range(app, tmp_path, monkeypatch):
+    monkeypatch.setattr(main, "LARGE_FILE_SIZE", 1000)
+    monkeypatch.setattr(main, "ENCRYPT_RANGE_SIZE", 300)
+    src = tmp_path / "big.bin"
+    src.write_bytes(os.urandom(1000))
+    expected = tmp_path / "expected.bin"
+    main._encrypt_file_worker(str(src), str(expected))
+
+    reported = []
+    backend = main.LocalBackend(str(tmp_path / "out"), main.CpuExecutor("thread", 2))
+    try:
+        backend.put_file(str(src), "big.bin", main.ENCRYPTION_KEY, reported.append).result()
+    finally:
+        backend.executor.shutdown()
+    assert reported == [300, 300, 300, 100]
+    out = tmp_path / "out" / "big.bin"
+    assert out.read_bytes() == expected.read_bytes()
+    assert out.stat().st_mtime_ns == src.stat().st_mtime_ns